@@ -3,28 +3,39 @@ import cv2
 import mediapipe as mp
 import numpy as np
 from flask_cors import CORS
-import base64
+from werkzeug.exceptions import HTTPException
+import binascii
 import time
 import json
 import os
 import sys
+import math
 import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
 
-# Configure logging
+# Check if running in deployment
+is_deployment = os.environ.get('DEPLOYMENT', 'false').lower() == 'true'
+
+# Configure logging - deployments only log warnings and errors
 logging.basicConfig(
-    level=logging.INFO,
+    level=logging.WARNING if is_deployment else logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-# Check if running in deployment
-is_deployment = os.environ.get('DEPLOYMENT', 'false').lower() == 'true'
-
 # Record startup time
 startup_time = time.time()
 
-# Set to True to enable detailed debug output for algorithm tuning
-DEBUG_MODE = True
+# Set to True to enable detailed debug output for algorithm tuning.
+# The per-frame detectors only build their log messages when debug logging is
+# enabled, so formatting costs nothing otherwise.
+DEBUG_MODE = False
+
+if DEBUG_MODE:
+    logger.setLevel(logging.DEBUG)
 
 if is_deployment:
     logger.info("Running in deployment mode")
@@ -45,188 +56,473 @@ except ImportError as e:
     logger.error(f"Failed to import required libraries: {e}")
     # Don't crash, we'll handle this in the API endpoints
 
+# Numba is optional - without it the tracking kernels run as plain Python
+try:
+    from numba import njit
+    logger.info("Numba loaded, tracking kernels will be JIT-compiled")
+except ImportError:
+    logger.warning("Numba not installed, tracking kernels will run as plain Python")
+    
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit that leaves the function uncompiled"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# orjson is optional - without it responses are encoded with the json module
+try:
+    import orjson
+    
+    def dumps_json(obj):
+        """Encode obj as JSON bytes"""
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    logger.info("orjson loaded, responses will be encoded with orjson")
+except ImportError:
+    logger.warning("orjson not installed, responses will be encoded with json")
+    
+    def dumps_json(obj):
+        """Encode obj as JSON bytes"""
+        return json.dumps(obj).encode()
+
+# TurboJPEG is optional - it decodes JPEGs straight to RGB, without it frames
+# are decoded to BGR by OpenCV and converted. PyTurboJPEG raises RuntimeError
+# when the libturbojpeg shared library itself is missing.
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    turbo_jpeg = TurboJPEG()
+    logger.info("TurboJPEG loaded, JPEG frames will be decoded straight to RGB")
+except (ImportError, RuntimeError):
+    turbo_jpeg = None
+    logger.warning("TurboJPEG not available, frames will be decoded with OpenCV")
+
 # Initialize MediaPipe components
 mp_face_mesh = mp.solutions.face_mesh
 mp_face_detection = mp.solutions.face_detection
 mp_drawing = mp.solutions.drawing_utils
 mp_pose = mp.solutions.pose
 
-# Initialize the Face Mesh, Face Detection and Pose models
-face_mesh = mp_face_mesh.FaceMesh(
-    max_num_faces=1,
-    refine_landmarks=True,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5
-)
+# OpenCV's own worker threads would only compete with the inference threads for cores
+cv2.setNumThreads(1)
 
+# Initialize the Face Detection model
 face_detection = mp_face_detection.FaceDetection(
     model_selection=0,
     min_detection_confidence=0.5
 )
 
-pose = mp_pose.Pose(
+# There is one Face Mesh and one Pose instance. Each is created on first use by
+# its model's executor thread (see below), the only thread that ever calls it,
+# since MediaPipe solutions are not reentrant.
+# Both run in video mode (static_image_mode=False): once a face or person is
+# found, the next frames only run the landmark model on the region tracked from
+# the previous frame, and the detector runs again only when tracking is lost.
+# That relies on every frame of the stream reaching the same instance in order.
+FACE_MESH_OPTIONS = dict(
+    static_image_mode=False,
+    max_num_faces=1,
+    refine_landmarks=True,
     min_detection_confidence=0.5,
     min_tracking_confidence=0.5
 )
+# Pose uses its lite model by default. Posture only needs the shoulders, hips,
+# ears and nose, which the lite model finds well at a fraction of the cost.
+# Set POSE_MODEL_COMPLEXITY to 1 (full) or 2 (heavy) for the larger models.
+POSE_MODEL_COMPLEXITY = int(os.environ.get('POSE_MODEL_COMPLEXITY', '0'))
+POSE_OPTIONS = dict(
+    static_image_mode=False,
+    model_complexity=POSE_MODEL_COMPLEXITY,
+    min_detection_confidence=0.5,
+    min_tracking_confidence=0.5
+)
+face_mesh = None
+pose = None
+
+def face_mesh_process(rgb_frame):
+    """Run Face Mesh on an RGB frame, on face_mesh_executor's thread"""
+    global face_mesh
+    if face_mesh is None:
+        face_mesh = mp_face_mesh.FaceMesh(**FACE_MESH_OPTIONS)
+    return face_mesh.process(rgb_frame)
+
+def pose_process(rgb_frame):
+    """Run Pose on an RGB frame, on pose_executor's thread"""
+    global pose
+    if pose is None:
+        pose = mp_pose.Pose(**POSE_OPTIONS)
+    return pose.process(rgb_frame)
+
+# Face Mesh and Pose are independent graphs that release the GIL while running,
+# so each frame is sent to both at once and their inference overlaps. Each model
+# has a single thread of its own, which owns its instance, so the instance sees
+# every frame in order and can track landmarks from one frame to the next.
+face_mesh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="face-mesh")
+pose_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pose")
+
+# Requests don't call MediaPipe themselves. They queue their frame and a single
+# background worker drains the queue in micro-batches, which keeps the graphs
+# warm and makes sure each model only ever sees one frame at a time.
+INFERENCE_BATCH_MAX = 4      # Most frames taken from the queue in one batch
+INFERENCE_BATCH_WAIT = 0.02  # Seconds spent collecting already-queued frames into a batch
+INFERENCE_TIMEOUT = 5.0      # Seconds a request waits for its frame (allows for model warm-up)
+MAX_BATCH_FRAMES = 16        # Most frames accepted by one /process_frames request
+inference_queue = queue.Queue()
+
+def submit_models(rgb_frame, run_pose=True):
+    """Start Face Mesh and Pose on one RGB frame and return their futures
+    
+    With run_pose=False only Face Mesh runs and the Pose future is None.
+    """
+    face_mesh_future = face_mesh_executor.submit(face_mesh_process, rgb_frame)
+    pose_future = pose_executor.submit(pose_process, rgb_frame) if run_pose else None
+    return face_mesh_future, pose_future
+
+def inference_worker():
+    """Background loop that runs queued frames through MediaPipe"""
+    while True:
+        batch = [inference_queue.get()]
+        batch_start = time.time()
+        while len(batch) < INFERENCE_BATCH_MAX and (time.time() - batch_start) < INFERENCE_BATCH_WAIT:
+            try:
+                batch.append(inference_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        # Hand every frame of the batch to the model threads before waiting on
+        # any of them, so Face Mesh can start on the next frame while Pose is
+        # still busy with the previous one
+        pending = []
+        for rgb_frame, run_pose, future in batch:
+            if future.set_running_or_notify_cancel():
+                pending.append((future, submit_models(rgb_frame, run_pose)))
+        
+        for future, (face_mesh_future, pose_future) in pending:
+            try:
+                pose_results = pose_future.result() if pose_future is not None else None
+                future.set_result((face_mesh_future.result(), pose_results))
+            except Exception as e:
+                future.set_exception(e)
+
+def queue_inference(rgb_frame, run_pose=True):
+    """Queue a frame for inference and return a future for its (face_mesh, pose) results"""
+    future = Future()
+    inference_queue.put((rgb_frame, run_pose, future))
+    return future
+
+inference_thread = threading.Thread(target=inference_worker, name="inference-worker", daemon=True)
+inference_thread.start()
 
 # Define eye landmarks indices
-LEFT_EYE_INDICES = [362, 385, 387, 263, 373, 380]
-RIGHT_EYE_INDICES = [33, 160, 158, 133, 153, 144]
-
-# Global tracking variables
-blink_count = 0
-eye_movement_count = 0
-posture_change_count = 0
-last_eye_pos = None
-last_posture = None
+LEFT_EYE_INDICES = np.array([362, 385, 387, 263, 373, 380], dtype=np.int32)
+RIGHT_EYE_INDICES = np.array([33, 160, 158, 133, 153, 144], dtype=np.int32)
+# The distances the EAR is built from, as landmark pairs for both eyes: per eye
+# the two vertical distances (p1-p5, p2-p4), then the horizontal one (p0-p3)
+EAR_PAIR_START = np.concatenate((LEFT_EYE_INDICES[[1, 2, 0]], RIGHT_EYE_INDICES[[1, 2, 0]]))
+EAR_PAIR_END = np.concatenate((LEFT_EYE_INDICES[[5, 4, 3]], RIGHT_EYE_INDICES[[5, 4, 3]]))
+
+def ring_ordered(buf, head, length):
+    """Return the valid entries of a ring buffer, oldest first"""
+    if length < len(buf):
+        # Not wrapped yet, entries are already in order
+        return buf[:length]
+    return np.concatenate((buf[head:], buf[:head]))
+
+# Landmark arrays are reused from frame to frame. Requests are served on several
+# threads, so every thread gets its own set of buffers.
+landmark_buffers = threading.local()
+FACE_LANDMARK_COUNT = 478  # 468 face points + 10 iris points with refine_landmarks
+POSE_LANDMARK_COUNT = 33
+
+def fill_buf(lmlist, out):
+    """Copy the x, y, z of each landmark in a MediaPipe landmark list into out"""
+    # One tuple per landmark and a single bulk assignment, instead of three
+    # element-wise array writes per landmark
+    out[:len(lmlist.landmark)] = [(l.x, l.y, l.z) for l in lmlist.landmark]
+
+def lm_to_np(lmlist, buffer_name, rows):
+    """Convert a MediaPipe landmark list into an (N, 3) float32 array of x, y, z
+    
+    Done once per frame so the detectors can slice the array instead of
+    reading protobuf attributes landmark by landmark. The array is this
+    thread's buffer_name buffer and is overwritten by its next frame.
+    """
+    n = len(lmlist.landmark)
+    out = getattr(landmark_buffers, buffer_name, None)
+    if out is None or len(out) < n:
+        out = np.empty((max(rows, n), 3), dtype=np.float32)
+        setattr(landmark_buffers, buffer_name, out)
+    fill_buf(lmlist, out)
+    return out[:n]
+
+# Posture changes slowly, so Pose (the heavier model) is skipped on frames that
+# barely differ from the previous one and the last posture is counted again.
+# Frames are compared as small grayscale thumbnails.
+MOTION_THUMB_SIZE = (80, 60)
+MOTION_EPS = 2.0          # Mean absolute thumbnail difference (gray levels) that counts as motion
+POSE_REFRESH_FRAMES = 5   # Pose still runs at least every this many frames
+
+def motion_thumbnail(rgb_frame):
+    """Downscale an RGB frame to the small grayscale image used by the motion gate"""
+    small = cv2.resize(rgb_frame, MOTION_THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+
+# Frames wider than this are downscaled to it before inference. Face Mesh and
+# Pose crop the face, iris and body regions out of the input frame, so this width
+# decides how many pixels the face and the iris landmarks used for gaze get.
+# At 640 px a face at normal webcam distance stays well over 100 px wide.
+# Set MODEL_INPUT_WIDTH to trade landmark precision for speed. The aspect ratio
+# is kept since the detectors work on normalized coordinates and their angles
+# would be skewed by a stretched frame.
+MODEL_INPUT_WIDTH = int(os.environ.get('MODEL_INPUT_WIDTH', '640'))
+# Each request thread converts into its own reused RGB buffer
+frame_buffers = threading.local()
+
+def prepare_frame(frame, slot=0, is_rgb=False):
+    """Downscale a decoded frame and convert it to RGB for MediaPipe
+    
+    The frame is BGR unless is_rgb is set. The result is marked read-only so
+    MediaPipe can wrap it without copying. Unless an RGB frame is already small
+    enough to be used as it is, the result is one of this thread's RGB buffers.
+    It is overwritten by the thread's next frame in the same slot, so frames that
+    are in flight together need different slots.
+    """
+    h, w = frame.shape[:2]
+    size = None
+    if w > MODEL_INPUT_WIDTH:
+        size = (MODEL_INPUT_WIDTH, max(1, round(h * MODEL_INPUT_WIDTH / w)))
+    
+    if is_rgb and size is None:
+        frame.flags.writeable = False
+        return frame
+    
+    if size is not None:
+        shape = (size[1], size[0], 3)
+    else:
+        shape = frame.shape
+    buffers = getattr(frame_buffers, "rgb", None)
+    if buffers is None:
+        buffers = frame_buffers.rgb = {}
+    rgb = buffers.get(slot)
+    if rgb is None or rgb.shape != shape:
+        rgb = np.empty(shape, dtype=np.uint8)
+        buffers[slot] = rgb
+    rgb.flags.writeable = True
+    if is_rgb:
+        cv2.resize(frame, size, dst=rgb, interpolation=cv2.INTER_AREA)
+    else:
+        if size is not None:
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb)
+    rgb.flags.writeable = False
+    return rgb
+
+def release_frame_buffer(slot):
+    """Stop reusing this thread's RGB buffer for slot
+    
+    For frames that may still be read by inference after their request gave up
+    on them. The next frame in the slot gets a new buffer, and the old one stays
+    alive for as long as the inference queue refers to it.
+    """
+    buffers = getattr(frame_buffers, "rgb", None)
+    if buffers is not None:
+        buffers.pop(slot, None)
+
 blink_threshold = 0.25
-session_data = {
-    "time_series": [],
-    "facial_expressions": {
-        "neutral": 0,
-        "focused": 0,
-        "confused": 0,
-        "distracted": 0
-    },
-    "posture_states": {
-        "upright": 0,
-        "leaning_forward": 0,
-        "slouching": 0,
-        "away": 0
+
+# Per-frame classification counters, indexed by the constants below. They are
+# only turned into name -> count dicts when the results are serialized.
+EXPRESSION_NEUTRAL = 0
+EXPRESSION_FOCUSED = 1
+EXPRESSION_CONFUSED = 2
+EXPRESSION_DISTRACTED = 3
+EXPRESSION_NAMES = ("neutral", "focused", "confused", "distracted")
+
+POSTURE_UPRIGHT = 0
+POSTURE_LEANING_FORWARD = 1
+POSTURE_SLOUCHING = 2
+POSTURE_AWAY = 3
+POSTURE_STATE_NAMES = ("upright", "leaning_forward", "slouching", "away")
+
+def counts_to_dict(counts, names):
+    """Turn a counter array into the name -> count dict sent to the client"""
+    return {name: int(count) for name, count in zip(names, counts)}
+
+@dataclass(slots=True)
+class SessionClock:
+    """Number of frames processed in the session and when the first and latest arrived"""
+    count: int = 0            # Frames processed
+    first_time: float = 0.0   # Timestamp of the first frame of the session
+    last_time: float = 0.0    # Timestamp of the latest frame
+    
+    def tick(self, timestamp):
+        """Record one processed frame"""
+        if self.count == 0:
+            self.first_time = timestamp
+        self.last_time = timestamp
+        self.count += 1
+    
+    def duration(self):
+        """Seconds between the first and the latest frame"""
+        return self.last_time - self.first_time
+
+def session_snapshot(state):
+    """Return the session data in the form it is serialized to JSON
+    
+    Only session summaries are kept, not per-frame values.
+    """
+    return {
+        "frame_count": state.clock.count,
+        "session_duration": state.clock.duration(),
+        "facial_expressions": counts_to_dict(state.expression_counts, EXPRESSION_NAMES),
+        "posture_states": counts_to_dict(state.posture_counts, POSTURE_STATE_NAMES)
     }
-}
 
 def reset_tracking_vars():
     """Reset tracking variables to initial state"""
-    global blink_count, eye_movement_count, posture_change_count
-    global last_eye_pos, last_posture, last_posture_vector, blink_state, last_ear, frames_below_threshold
-    global ear_history, current_blink_state, last_blink_time
-    global session_data
-    
-    # Reset eye movement variables
-    global eye_pos_history, last_significant_movement_time, eye_movement_baseline
-    
-    # Reset posture variables
-    global posture_history, last_significant_posture_time, posture_baseline_diff
-    
-    # Reset all blink variables
-    global last_blink_time, BLINK_COOLDOWN, blink_confirmation_counter, current_ear_velocity
-    global last_ear_measurement_time
-    
-    # Reset counters
-    blink_count = 0
-    eye_movement_count = 0
-    posture_change_count = 0
-    
-    # Reset eye movement tracking variables
-    last_eye_pos = None
-    eye_pos_history = []
-    last_significant_movement_time = 0
-    eye_movement_baseline = 0.01
-    
-    # Reset posture tracking variables
-    last_posture = None
-    last_posture_vector = None
-    posture_history = []
-    last_significant_posture_time = 0
-    posture_baseline_diff = 0.05
-    
-    # Reset blink detection variables
-    blink_state = False
-    last_ear = 1.0
-    frames_below_threshold = 0
-    ear_history = []
-    current_blink_state = BLINK_STATE_OPEN
-    last_blink_time = 0
-    blink_confirmation_counter = 0
-    current_ear_velocity = 0
-    last_ear_measurement_time = 0
-    
-    # Reset session data
-    session_data = {
-        "time_series": [],
-        "facial_expressions": {
-            "neutral": 0,
-            "focused": 0,
-            "confused": 0,
-            "distracted": 0
-        },
-        "posture_states": {
-            "upright": 0,
-            "leaning_forward": 0,
-            "slouching": 0,
-            "away": 0
-        }
-    }
+    global STATE
     
-    print("Tracking variables reset successfully")
-
-def calculate_ear(landmarks, eye_indices):
-    """Calculate the Eye Aspect Ratio (EAR) for blink detection"""
-    pts = [landmarks[idx] for idx in eye_indices]
+    # Frames already in flight finish on the old state object
+    STATE = TrackingState()
     
-    # Compute horizontal distance
-    h_dist = np.linalg.norm(np.array([pts[0].x, pts[0].y]) - np.array([pts[3].x, pts[3].y]))
+    logger.info("Tracking variables reset successfully")
+
+def calculate_ears(lm):
+    """Calculate the Eye Aspect Ratio (EAR) of both eyes for blink detection
     
-    # Compute vertical distances
-    v1 = np.linalg.norm(np.array([pts[1].x, pts[1].y]) - np.array([pts[5].x, pts[5].y]))
-    v2 = np.linalg.norm(np.array([pts[2].x, pts[2].y]) - np.array([pts[4].x, pts[4].y]))
+    lm is the (N, 3) Face Mesh landmark array from lm_to_np. Returns a float32
+    array holding the left and right EAR.
+    """
+    # All six distances in one pass, one row per eye: vertical, vertical, horizontal
+    d = lm[EAR_PAIR_START, :2] - lm[EAR_PAIR_END, :2]
+    dist = np.sqrt((d * d).sum(axis=1)).reshape(2, 3)
     
     # Average vertical distance
-    v_dist = (v1 + v2) / 2.0
-    
-    # Calculate EAR
-    ear = v_dist / h_dist if h_dist > 0 else 0
+    v_dist = (dist[:, 0] + dist[:, 1]) / 2.0
+    h_dist = dist[:, 2]
     
-    return ear
+    # Calculate EAR, 0 for an eye whose corners coincide
+    return np.divide(v_dist, h_dist, out=np.zeros_like(v_dist), where=h_dist > 0)
 
 # Enhanced blink detection variables
-blink_state = False
-last_ear = 1.0
-frames_below_threshold = 0
-ear_history = []  # Track recent EAR values to detect patterns
 EAR_HISTORY_SIZE = 10  # Keep track of the last 10 frames
 MIN_FRAMES_FOR_BLINK = 2  # Minimum consecutive frames with closed eyes
 CLOSED_TO_OPEN_TIME_WINDOW = 0.5  # Time window in seconds to detect a complete blink
-last_blink_time = 0
 BLINK_COOLDOWN = 0.2  # Seconds between blinks to avoid double counting
-blink_confirmation_counter = 0
-current_ear_velocity = 0
-last_ear_measurement_time = 0
 
 # We'll use a state machine approach for more accurate detection
 BLINK_STATE_OPEN = 0      # Eyes are open
 BLINK_STATE_CLOSING = 1   # Eyes are in the process of closing
 BLINK_STATE_CLOSED = 2    # Eyes are closed
 BLINK_STATE_OPENING = 3   # Eyes are in the process of opening
-current_blink_state = BLINK_STATE_OPEN
 
-def detect_blink(landmarks):
-    """Detect eye blinks with improved accuracy using a state machine approach"""
-    global blink_count, blink_state, last_ear, frames_below_threshold
-    global ear_history, current_blink_state, last_blink_time
-    global BLINK_COOLDOWN, blink_confirmation_counter, current_ear_velocity
-    global last_ear_measurement_time
-    
-    # Get EAR for both eyes
-    left_ear = calculate_ear(landmarks, LEFT_EYE_INDICES)
-    right_ear = calculate_ear(landmarks, RIGHT_EYE_INDICES)
+# The blink state machine keeps its state in one float64 array so it can be
+# updated in place by the compiled kernel. These are the slots of that array.
+BS_CURRENT_STATE = 0            # One of the BLINK_STATE_* values
+BS_LAST_BLINK_TIME = 1
+BS_CONFIRMATION_COUNTER = 2
+BS_EAR_VELOCITY = 3
+BS_FRAMES_BELOW_THRESHOLD = 4
+BS_LAST_EAR = 5
+BS_BLINK_COUNT = 6
+BS_LAST_MEASUREMENT_TIME = 7
+BS_OPEN_THRESHOLD = 8           # Thresholds used on the last fully evaluated frame
+BS_CLOSED_THRESHOLD = 9
+BS_CLOSING_THRESHOLD = 10
+BS_OPENING_THRESHOLD = 11
+BS_THRESHOLD_AGE = 12           # Frames since the thresholds were last recomputed
+BS_BASELINE_EAR = 13            # EAR on the frame the thresholds were last recomputed
+BLINK_STATE_SIZE = 14
+
+# Adaptive baselines are refit every this many frames instead of on every frame
+BASELINE_REFRESH_FRAMES = 10
+# ...or sooner when the EAR moved by more than this fraction since the last refit
+BASELINE_REFRESH_EAR_CHANGE = 0.05
+
+# Frames where the eyes are clearly and steadily open skip the threshold update
+# and the detectors, since none of them can fire
+EAR_FAST_PATH_MIN = 0.30
+
+# Which detector counted a blink on the current frame
+BLINK_NONE = 0
+BLINK_BY_VELOCITY = 1
+BLINK_BY_STATE_MACHINE = 2
+BLINK_BY_RAPID_CHANGE = 3
+BLINK_BY_PATTERN = 4
+BLINK_DETECTOR_NAMES = ("NO", "VELOCITY-BASED", "COMPLETE", "RAPID", "PATTERN-BASED")
+
+def new_blink_state():
+    """Create a blink state array in its initial state"""
+    state = np.zeros(BLINK_STATE_SIZE, dtype=np.float64)
+    state[BS_CURRENT_STATE] = BLINK_STATE_OPEN
+    state[BS_LAST_EAR] = 1.0
+    state[BS_OPEN_THRESHOLD] = 0.22
+    state[BS_CLOSED_THRESHOLD] = 0.16
+    state[BS_CLOSING_THRESHOLD] = 0.19
+    state[BS_OPENING_THRESHOLD] = 0.18
+    state[BS_THRESHOLD_AGE] = 0
+    state[BS_BASELINE_EAR] = 1.0
+    return state
+
+@njit(cache=True, fastmath=True)
+def _blink_step(ear_buf, t_buf, head, length, state):
+    """Advance the blink state machine by one frame
+    
+    head and length describe the EAR ring buffers after the newest value was
+    written. state is a blink state array and is updated in place.
+    Returns (detector that counted a blink, closed threshold, open threshold).
+    """
+    size = ear_buf.shape[0]
+    newest = (head - 1) % size
+    avg_ear = ear_buf[newest]
+    current_time = t_buf[newest]
     
-    # Average EAR - use max for robustness against detection errors in one eye
-    avg_ear = (left_ear + right_ear) / 2.0
+    # Initialize return value
+    detected_by = BLINK_NONE
     
-    # Add to history
-    current_time = time.time()
-    ear_history.append((avg_ear, current_time))
-    if len(ear_history) > EAR_HISTORY_SIZE:
-        ear_history.pop(0)  # Remove oldest entry
+    # Calculate velocity of EAR change - helps detect rapid blinks
+    if length >= 2:
+        prev_idx = (head - 2) % size
+        time_diff = current_time - t_buf[prev_idx]
+        if time_diff > 0:
+            state[BS_EAR_VELOCITY] = (ear_buf[prev_idx] - avg_ear) / time_diff
+            
+            # Extremely high velocities indicate very rapid blinks that might be missed
+            if state[BS_EAR_VELOCITY] > 1.5 and state[BS_CURRENT_STATE] == BLINK_STATE_OPEN:
+                state[BS_CONFIRMATION_COUNTER] += 1
+                if state[BS_CONFIRMATION_COUNTER] >= 2:
+                    if (current_time - state[BS_LAST_BLINK_TIME]) > BLINK_COOLDOWN:
+                        state[BS_BLINK_COUNT] += 1
+                        detected_by = BLINK_BY_VELOCITY
+                        state[BS_LAST_BLINK_TIME] = current_time
+                    state[BS_CONFIRMATION_COUNTER] = 0
+    
+    # Fast path: eyes steadily open. The EAR is well above the last closing
+    # threshold, isn't dropping fast, and neither the rapid-change nor the
+    # pattern detector can fire on this frame, so skip the rest.
+    if (state[BS_CURRENT_STATE] == BLINK_STATE_OPEN and length >= 5 and
+            detected_by == BLINK_NONE and
+            avg_ear > max(EAR_FAST_PATH_MIN, state[BS_CLOSING_THRESHOLD] * 1.1) and
+            state[BS_EAR_VELOCITY] < 0.5 and
+            ear_buf[(head - 3) % size] - avg_ear <= 0.08 and
+            avg_ear - ear_buf[(head - 2) % size] <= 0.02):
+        state[BS_LAST_EAR] = avg_ear
+        state[BS_LAST_MEASUREMENT_TIME] = current_time
+        return BLINK_NONE, state[BS_CLOSED_THRESHOLD], state[BS_OPEN_THRESHOLD]
     
     # Calculate dynamic thresholds based on the person's baseline
     # Start with defaults but adjust as we collect more data
-    if len(ear_history) >= 5:
-        # Sort EAR values to find typical open eye value (upper percentile)
-        sorted_ears = sorted([e[0] for e in ear_history])
-        open_eye_baseline = sorted_ears[int(len(sorted_ears) * 0.8)]  # 80th percentile
+    # The baseline drifts slowly, so only refit it every few frames or when the EAR
+    # has moved noticeably since the last refit
+    if length >= 5 and (state[BS_THRESHOLD_AGE] % BASELINE_REFRESH_FRAMES != 0 and
+                        abs(avg_ear - state[BS_BASELINE_EAR]) <= BASELINE_REFRESH_EAR_CHANGE * state[BS_BASELINE_EAR]):
+        blink_open_threshold = state[BS_OPEN_THRESHOLD]
+        blink_closed_threshold = state[BS_CLOSED_THRESHOLD]
+        closing_threshold = state[BS_CLOSING_THRESHOLD]
+        opening_threshold = state[BS_OPENING_THRESHOLD]
+        state[BS_THRESHOLD_AGE] += 1
+    elif length >= 5:
+        # Select the typical open eye value (upper percentile) without a full sort
+        k = int(length * 0.8)
+        open_eye_baseline = np.partition(ear_buf[:length], k)[k]  # 80th percentile
         
         # Adapt thresholds based on the person's eye characteristics
         # IMPROVED: Lower thresholds to catch more subtle blinks (making detection more sensitive)
@@ -236,6 +532,8 @@ def detect_blink(landmarks):
         # For transitional states - also adjusted
         closing_threshold = max(0.19, open_eye_baseline * 0.70)  # 70% of baseline (was 75%)
         opening_threshold = max(0.18, open_eye_baseline * 0.65)  # 65% of baseline (was 70%)
+        state[BS_THRESHOLD_AGE] = 1
+        state[BS_BASELINE_EAR] = avg_ear
     else:
         # Default thresholds until we have enough data - more sensitive than before
         blink_open_threshold = 0.22  # Was 0.25
@@ -243,321 +541,427 @@ def detect_blink(landmarks):
         closing_threshold = 0.19  # Was 0.22
         opening_threshold = 0.18  # Was 0.21
     
-    # Debug info
-    if DEBUG_MODE:
-        print(f"EAR: {avg_ear:.4f}, State: {current_blink_state}, Thresholds: {blink_closed_threshold:.2f}/{blink_open_threshold:.2f}")
-    
-    # Initialize return value
-    blink_detected = False
-    
-    # Calculate velocity of EAR change - helps detect rapid blinks
-    if len(ear_history) >= 2:
-        time_diff = current_time - ear_history[-2][1]
-        if time_diff > 0:
-            current_ear_velocity = (ear_history[-2][0] - avg_ear) / time_diff
-            
-            # Extremely high velocities indicate very rapid blinks that might be missed
-            if current_ear_velocity > 1.5 and current_blink_state == BLINK_STATE_OPEN:
-                if DEBUG_MODE:
-                    print(f"High velocity EAR change detected: {current_ear_velocity:.2f}/s")
-                blink_confirmation_counter += 1
-                if blink_confirmation_counter >= 2:
-                    if (current_time - last_blink_time) > BLINK_COOLDOWN:
-                        blink_count += 1
-                        blink_detected = True
-                        last_blink_time = current_time
-                        if DEBUG_MODE:
-                            print(f"VELOCITY-BASED BLINK DETECTED! Count: {blink_count}")
-                    blink_confirmation_counter = 0
+    state[BS_OPEN_THRESHOLD] = blink_open_threshold
+    state[BS_CLOSED_THRESHOLD] = blink_closed_threshold
+    state[BS_CLOSING_THRESHOLD] = closing_threshold
+    state[BS_OPENING_THRESHOLD] = opening_threshold
     
     # State machine logic for blink detection
-    if current_blink_state == BLINK_STATE_OPEN:
+    current_state = state[BS_CURRENT_STATE]
+    if current_state == BLINK_STATE_OPEN:
         # Check if eyes are starting to close
         if avg_ear < closing_threshold:
-            current_blink_state = BLINK_STATE_CLOSING
-            if DEBUG_MODE:
-                print("Eyes starting to close")
+            state[BS_CURRENT_STATE] = BLINK_STATE_CLOSING
             
-    elif current_blink_state == BLINK_STATE_CLOSING:
+    elif current_state == BLINK_STATE_CLOSING:
         # Check if eyes are now fully closed
         if avg_ear < blink_closed_threshold:
-            current_blink_state = BLINK_STATE_CLOSED
-            frames_below_threshold = 1
-            if DEBUG_MODE:
-                print("Eyes closed")
+            state[BS_CURRENT_STATE] = BLINK_STATE_CLOSED
+            state[BS_FRAMES_BELOW_THRESHOLD] = 1
         # Or if they opened again without fully closing (abandoned blink)
         elif avg_ear > blink_open_threshold:
-            current_blink_state = BLINK_STATE_OPEN
-            if DEBUG_MODE:
-                print("Abandoned blink")
+            state[BS_CURRENT_STATE] = BLINK_STATE_OPEN
             
-    elif current_blink_state == BLINK_STATE_CLOSED:
+    elif current_state == BLINK_STATE_CLOSED:
         # Keep track of how long eyes have been closed
         if avg_ear < blink_closed_threshold:
-            frames_below_threshold += 1
+            state[BS_FRAMES_BELOW_THRESHOLD] += 1
         # Check if eyes are starting to open
         elif avg_ear > opening_threshold:
-            current_blink_state = BLINK_STATE_OPENING
-            if DEBUG_MODE:
-                print("Eyes starting to open")
+            state[BS_CURRENT_STATE] = BLINK_STATE_OPENING
             
-    elif current_blink_state == BLINK_STATE_OPENING:
+    elif current_state == BLINK_STATE_OPENING:
         # Check if eyes are fully open again - this completes a blink
         if avg_ear > blink_open_threshold:
             # IMPROVED: Reduced the minimum frames requirement
             # Only count as a blink if it was a proper sequence (but less strict)
-            if frames_below_threshold >= 1:  # Was 2
+            if state[BS_FRAMES_BELOW_THRESHOLD] >= 1:  # Was 2
                 # IMPROVED: Shorter cooldown between blinks
-                if (current_time - last_blink_time) > BLINK_COOLDOWN:
-                    blink_count += 1
-                    blink_detected = True
-                    last_blink_time = current_time
-                    print(f"COMPLETE BLINK DETECTED! Count: {blink_count}")
+                if (current_time - state[BS_LAST_BLINK_TIME]) > BLINK_COOLDOWN:
+                    state[BS_BLINK_COUNT] += 1
+                    detected_by = BLINK_BY_STATE_MACHINE
+                    state[BS_LAST_BLINK_TIME] = current_time
             
             # Reset to open state
-            current_blink_state = BLINK_STATE_OPEN
-            frames_below_threshold = 0
-            if DEBUG_MODE:
-                print("Eyes fully open again")
+            state[BS_CURRENT_STATE] = BLINK_STATE_OPEN
+            state[BS_FRAMES_BELOW_THRESHOLD] = 0
         
         # If they close again without fully opening, go back to closed state
         elif avg_ear < blink_closed_threshold:
-            current_blink_state = BLINK_STATE_CLOSED
-            if DEBUG_MODE:
-                print("Eyes closed again without fully opening")
+            state[BS_CURRENT_STATE] = BLINK_STATE_CLOSED
     
     # Also detect rapid decreases in EAR which might be very quick blinks
     # This is a backup detection method with improved sensitivity
-    if len(ear_history) >= 3:
+    if length >= 3:
         # Look at EAR change over the last 3 frames
-        ear_change = ear_history[-3][0] - avg_ear
+        ear_change = ear_buf[(head - 3) % size] - avg_ear
         
         # IMPROVED: Lower threshold for detecting quick blinks
         if (ear_change > 0.08 and  # Was 0.12
-            current_blink_state == BLINK_STATE_OPEN and 
-            (current_time - last_blink_time) > BLINK_COOLDOWN):  # Shorter window
+            state[BS_CURRENT_STATE] == BLINK_STATE_OPEN and 
+            (current_time - state[BS_LAST_BLINK_TIME]) > BLINK_COOLDOWN):  # Shorter window
             
             # This looks like a rapid blink that our state machine might miss
-            print(f"RAPID BLINK DETECTED! (Backup method) Change: {ear_change:.3f}")
-            blink_count += 1
-            blink_detected = True
-            last_blink_time = current_time
+            state[BS_BLINK_COUNT] += 1
+            detected_by = BLINK_BY_RAPID_CHANGE
+            state[BS_LAST_BLINK_TIME] = current_time
             
     # Pattern-based detection for subtle blinks (new feature)
     # Look for characteristic pattern: decrease then increase
-    if len(ear_history) >= 5:
-        # Calculate the differences between consecutive frames
-        diffs = []
-        for i in range(1, len(ear_history)):
-            diffs.append(ear_history[i][0] - ear_history[i-1][0])
+    if length >= 5:
+        # Differences between the last 5 frames in time order
+        d1 = ear_buf[(head - 4) % size] - ear_buf[(head - 5) % size]
+        d2 = ear_buf[(head - 3) % size] - ear_buf[(head - 4) % size]
+        d3 = ear_buf[(head - 2) % size] - ear_buf[(head - 3) % size]
+        d4 = avg_ear - ear_buf[(head - 2) % size]
         
         # Pattern: significant decrease followed by significant increase
         # This catches subtle blinks that might not cross the threshold
-        if (len(diffs) >= 4 and
-            diffs[-4] < -0.03 and diffs[-3] < -0.03 and  # Two consecutive decreases
-            diffs[-2] > 0.02 and diffs[-1] > 0.02 and     # Two consecutive increases
-            (current_time - last_blink_time) > BLINK_COOLDOWN):
+        if (d1 < -0.03 and d2 < -0.03 and  # Two consecutive decreases
+            d3 > 0.02 and d4 > 0.02 and     # Two consecutive increases
+            (current_time - state[BS_LAST_BLINK_TIME]) > BLINK_COOLDOWN):
             
-            print(f"PATTERN-BASED BLINK DETECTED! Pattern: {diffs[-4]:.2f}, {diffs[-3]:.2f}, {diffs[-2]:.2f}, {diffs[-1]:.2f}")
-            blink_count += 1
-            blink_detected = True
-            last_blink_time = current_time
+            state[BS_BLINK_COUNT] += 1
+            detected_by = BLINK_BY_PATTERN
+            state[BS_LAST_BLINK_TIME] = current_time
     
     # Update last EAR for the next frame
-    last_ear = avg_ear
-    return blink_detected
+    state[BS_LAST_EAR] = avg_ear
+    state[BS_LAST_MEASUREMENT_TIME] = current_time
+    return detected_by, blink_closed_threshold, blink_open_threshold
+
+def detect_blink(lm, state, current_time):
+    """Detect eye blinks with improved accuracy using a state machine approach
+    
+    lm is the (N, 3) Face Mesh landmark array from lm_to_np, current_time the
+    frame's capture time in seconds.
+    """
+    
+    # Get EAR for both eyes in one pass
+    left_ear, right_ear = calculate_ears(lm).tolist()
+    
+    # Average EAR - use max for robustness against detection errors in one eye
+    avg_ear = (left_ear + right_ear) / 2.0
+    
+    # Add to history
+    idx = state.ear_head
+    state.ear_buf[idx] = avg_ear
+    state.t_buf[idx] = current_time
+    state.ear_head = (idx + 1) % EAR_HISTORY_SIZE  # Overwrites the oldest entry once full
+    state.ear_len = min(state.ear_len + 1, EAR_HISTORY_SIZE)
+    
+    previous_state = int(state.blink_state[BS_CURRENT_STATE])
+    detected_by, closed_threshold, open_threshold = _blink_step(state.ear_buf, state.t_buf, state.ear_head, state.ear_len, state.blink_state)
+    state.blink_count = int(state.blink_state[BS_BLINK_COUNT])
+    
+    # Debug info
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("EAR: %.4f, State: %d, Thresholds: %.2f/%.2f",
+                     avg_ear, previous_state, closed_threshold, open_threshold)
+        current_state = int(state.blink_state[BS_CURRENT_STATE])
+        if current_state != previous_state:
+            logger.debug("Blink state changed: %d -> %d", previous_state, current_state)
+        if detected_by != BLINK_NONE:
+            logger.debug("%s BLINK DETECTED! Count: %d", BLINK_DETECTOR_NAMES[detected_by], state.blink_count)
+    
+    return detected_by != BLINK_NONE
 
 # Eye movement detection variables
-last_eye_pos = None
-eye_pos_history = []  # Store recent eye positions
 EYE_POS_HISTORY_SIZE = 10  # Decreased for faster adaptation to new eyes
-last_significant_movement_time = 0
 MOVEMENT_DEBOUNCE_TIME = 0.3  # Decreased to catch more movements
-eye_movement_baseline = 0.01  # Much lower default threshold for better sensitivity
 
-def detect_eye_movement(landmarks):
-    """Detect eye movement with improved accuracy and reduced false positives"""
-    global eye_movement_count, last_eye_pos, eye_pos_history, last_significant_movement_time
-    global eye_movement_baseline
-    
-    current_time = time.time()
-    
+# Every Face Mesh landmark read by the gaze kernel, in the order it expects them
+GAZE_IDX = np.array([
+    468, 469, 470, 471, 472,  # Left pupil center and iris contour
+    473, 474, 475, 476, 477,  # Right pupil center and iris contour
+    263, 362, 386, 374,       # Left eye inner corner, outer corner, upper and lower eyelid
+    33, 133, 159, 145,        # Right eye inner corner, outer corner, upper and lower eyelid
+    168, 151,                 # Nose bridge and chin
+], dtype=np.int32)
+
+# The face orientation basis used to project the gaze is cached in a small float64
+# array owned by the gaze kernel. These are its slots.
+FB_VX = 0           # Unit vector from chin to nose bridge
+FB_VY = 1
+FB_HX = 2           # Unit vector between the inner eye corners
+FB_HY = 3
+FB_ANCHOR_X = 4     # Nose bridge position when the basis was last computed
+FB_ANCHOR_Y = 5
+FB_AGE = 6          # Frames since the basis was last computed
+FACE_BASIS_SIZE = 7
+# The head pose changes slowly, so the basis is only recomputed every
+# BASELINE_REFRESH_FRAMES frames or once the nose bridge moved this far
+FACE_BASIS_MAX_SHIFT = 0.02
+
+def new_face_basis():
+    """Create an empty face basis array, forcing a recompute on the next frame"""
+    return np.zeros(FACE_BASIS_SIZE, dtype=np.float64)
+
+@njit(cache=True)
+def _compute_gaze(lm, idx, basis):
+    """Compute the head-rotation invariant gaze direction from the landmark array
+    
+    idx is GAZE_IDX and basis is a face basis array, refreshed in place when
+    it is stale. Everything is done with scalar arithmetic so no temporary
+    arrays are created. Returns (gaze_h, gaze_v, eye_scale).
+    """
     # IMPROVED: Use more precise pupil landmarks with higher weighting on pupil center
-    # Original code used mean of all pupil landmarks; this version emphasizes the central pupil landmark
-    left_pupil_center = np.array([landmarks[468].x, landmarks[468].y])  # Central pupil landmark
-    left_pupil_points = np.array([[landmarks[idx].x, landmarks[idx].y] for idx in [469, 470, 471, 472]])
-    left_pupil = 0.6 * left_pupil_center + 0.4 * np.mean(left_pupil_points, axis=0)  # Weighted average
-    
-    right_pupil_center = np.array([landmarks[473].x, landmarks[473].y])  # Central pupil landmark
-    right_pupil_points = np.array([[landmarks[idx].x, landmarks[idx].y] for idx in [474, 475, 476, 477]])
-    right_pupil = 0.6 * right_pupil_center + 0.4 * np.mean(right_pupil_points, axis=0)  # Weighted average
-    
-    # Calculate eye corners for reference frame - with improved iris contour landmarks
-    # This gives more precise eye contour for normalization
-    left_eye_inner = np.array([landmarks[LEFT_EYE_INDICES[3]].x, landmarks[LEFT_EYE_INDICES[3]].y])
-    left_eye_outer = np.array([landmarks[LEFT_EYE_INDICES[0]].x, landmarks[LEFT_EYE_INDICES[0]].y])
-    right_eye_inner = np.array([landmarks[RIGHT_EYE_INDICES[0]].x, landmarks[RIGHT_EYE_INDICES[0]].y])
-    right_eye_outer = np.array([landmarks[RIGHT_EYE_INDICES[3]].x, landmarks[RIGHT_EYE_INDICES[3]].y])
-    
-    # Additional landmarks for better eye shape mapping
-    left_eye_top = np.array([landmarks[386].x, landmarks[386].y])  # Upper eyelid
-    left_eye_bottom = np.array([landmarks[374].x, landmarks[374].y])  # Lower eyelid
-    right_eye_top = np.array([landmarks[159].x, landmarks[159].y])  # Upper eyelid
-    right_eye_bottom = np.array([landmarks[145].x, landmarks[145].y])  # Lower eyelid
+    # Weighted average of the central pupil landmark (60%) and the iris contour (40%)
+    left_pupil_x = 0.6 * lm[idx[0], 0] + 0.1 * (lm[idx[1], 0] + lm[idx[2], 0] + lm[idx[3], 0] + lm[idx[4], 0])
+    left_pupil_y = 0.6 * lm[idx[0], 1] + 0.1 * (lm[idx[1], 1] + lm[idx[2], 1] + lm[idx[3], 1] + lm[idx[4], 1])
+    right_pupil_x = 0.6 * lm[idx[5], 0] + 0.1 * (lm[idx[6], 0] + lm[idx[7], 0] + lm[idx[8], 0] + lm[idx[9], 0])
+    right_pupil_y = 0.6 * lm[idx[5], 1] + 0.1 * (lm[idx[6], 1] + lm[idx[7], 1] + lm[idx[8], 1] + lm[idx[9], 1])
+    
+    # Eye corners and eyelids give the eye contour used for normalization
+    l_inner_x, l_inner_y = lm[idx[10], 0], lm[idx[10], 1]
+    l_outer_x, l_outer_y = lm[idx[11], 0], lm[idx[11], 1]
+    l_top_x, l_top_y = lm[idx[12], 0], lm[idx[12], 1]
+    l_bottom_x, l_bottom_y = lm[idx[13], 0], lm[idx[13], 1]
+    r_inner_x, r_inner_y = lm[idx[14], 0], lm[idx[14], 1]
+    r_outer_x, r_outer_y = lm[idx[15], 0], lm[idx[15], 1]
+    r_top_x, r_top_y = lm[idx[16], 0], lm[idx[16], 1]
+    r_bottom_x, r_bottom_y = lm[idx[17], 0], lm[idx[17], 1]
     
     # Calculate eye widths and heights for improved normalization
-    left_eye_width = np.linalg.norm(left_eye_outer - left_eye_inner)
-    right_eye_width = np.linalg.norm(right_eye_outer - right_eye_inner)
-    left_eye_height = np.linalg.norm(left_eye_top - left_eye_bottom)
-    right_eye_height = np.linalg.norm(right_eye_top - right_eye_bottom)
+    left_eye_width = math.sqrt((l_outer_x - l_inner_x) ** 2 + (l_outer_y - l_inner_y) ** 2)
+    right_eye_width = math.sqrt((r_outer_x - r_inner_x) ** 2 + (r_outer_y - r_inner_y) ** 2)
+    left_eye_height = math.sqrt((l_top_x - l_bottom_x) ** 2 + (l_top_y - l_bottom_y) ** 2)
+    right_eye_height = math.sqrt((r_top_x - r_bottom_x) ** 2 + (r_top_y - r_bottom_y) ** 2)
     
     # IMPROVED: Create dynamic eye box for normalization 
     # Normalize based on both width and height for better aspect ratio handling
-    left_eye_size = np.sqrt(left_eye_width * left_eye_height)
-    right_eye_size = np.sqrt(right_eye_width * right_eye_height)
+    left_eye_size = math.sqrt(left_eye_width * left_eye_height)
+    right_eye_size = math.sqrt(right_eye_width * right_eye_height)
     eye_scale = (left_eye_size + right_eye_size) / 2
     
-    # Create a coordinate system based on face orientation - improved stability
-    # Use more stable facial landmarks and weight them by reliability
-    # Nose bridge and eyes are more stable than chin or eyebrows
-    face_center = np.mean([
-        1.5 * np.array([landmarks[168].x, landmarks[168].y]),  # Nose bridge (higher weight)
-        0.7 * np.array([landmarks[151].x, landmarks[151].y]),  # Chin (lower weight)
-        1.0 * np.array([landmarks[8].x, landmarks[8].y]),      # Midpoint between eyes
-        1.0 * np.array([landmarks[200].x, landmarks[200].y])   # Center of lips
-    ], axis=0)
-    
     # IMPROVED: Create face orientation vectors to normalize for head rotation
     # These vectors help create a reference frame that's invariant to head rotation
-    face_vertical = np.array([landmarks[168].x, landmarks[168].y]) - np.array([landmarks[151].x, landmarks[151].y])
-    face_vertical = face_vertical / (np.linalg.norm(face_vertical) + 1e-6)  # Normalize
-    
-    face_horizontal = np.array([landmarks[33].x, landmarks[33].y]) - np.array([landmarks[263].x, landmarks[263].y])
-    face_horizontal = face_horizontal / (np.linalg.norm(face_horizontal) + 1e-6)  # Normalize
-    
-    # IMPROVED: Calculate gaze vector (direction of looking)
-    # This is more accurate than just using pupil position
-    left_gaze_vector = left_pupil - np.mean([left_eye_inner, left_eye_outer, left_eye_top, left_eye_bottom], axis=0)
-    right_gaze_vector = right_pupil - np.mean([right_eye_inner, right_eye_outer, right_eye_top, right_eye_bottom], axis=0)
-    
-    # Normalize gaze vectors by eye size
-    left_gaze_vector = left_gaze_vector / (left_eye_size + 1e-6)
-    right_gaze_vector = right_gaze_vector / (right_eye_size + 1e-6)
+    nose_x, nose_y = lm[idx[18], 0], lm[idx[18], 1]
+    if (basis[FB_AGE] % BASELINE_REFRESH_FRAMES == 0 or
+            math.sqrt((nose_x - basis[FB_ANCHOR_X]) ** 2 + (nose_y - basis[FB_ANCHOR_Y]) ** 2) > FACE_BASIS_MAX_SHIFT):
+        vx = nose_x - lm[idx[19], 0]
+        vy = nose_y - lm[idx[19], 1]
+        v_norm = math.sqrt(vx * vx + vy * vy) + 1e-6
+        basis[FB_VX] = vx / v_norm
+        basis[FB_VY] = vy / v_norm
+        
+        hx = r_inner_x - l_inner_x
+        hy = r_inner_y - l_inner_y
+        h_norm = math.sqrt(hx * hx + hy * hy) + 1e-6
+        basis[FB_HX] = hx / h_norm
+        basis[FB_HY] = hy / h_norm
+        
+        basis[FB_ANCHOR_X] = nose_x
+        basis[FB_ANCHOR_Y] = nose_y
+        basis[FB_AGE] = 0
+    basis[FB_AGE] += 1
+    vx, vy = basis[FB_VX], basis[FB_VY]
+    hx, hy = basis[FB_HX], basis[FB_HY]
+    
+    # IMPROVED: Calculate gaze vector (direction of looking) relative to the eye center,
+    # normalized by eye size
+    left_gaze_x = (left_pupil_x - (l_inner_x + l_outer_x + l_top_x + l_bottom_x) * 0.25) / (left_eye_size + 1e-6)
+    left_gaze_y = (left_pupil_y - (l_inner_y + l_outer_y + l_top_y + l_bottom_y) * 0.25) / (left_eye_size + 1e-6)
+    right_gaze_x = (right_pupil_x - (r_inner_x + r_outer_x + r_top_x + r_bottom_x) * 0.25) / (right_eye_size + 1e-6)
+    right_gaze_y = (right_pupil_y - (r_inner_y + r_outer_y + r_top_y + r_bottom_y) * 0.25) / (right_eye_size + 1e-6)
     
     # Average the normalized gaze vectors from both eyes
-    gaze_vector = (left_gaze_vector + right_gaze_vector) / 2.0
+    gaze_x = (left_gaze_x + right_gaze_x) / 2.0
+    gaze_y = (left_gaze_y + right_gaze_y) / 2.0
     
     # Project gaze into face coordinate system to make it invariant to head rotation
-    gaze_h = np.dot(gaze_vector, face_horizontal)
-    gaze_v = np.dot(gaze_vector, face_vertical)
-    normalized_gaze = np.array([gaze_h, gaze_v])
+    gaze_h = gaze_x * hx + gaze_y * hy
+    gaze_v = gaze_x * vx + gaze_y * vy
+    return gaze_h, gaze_v, eye_scale
+
+def detect_eye_movement(lm, state, current_time):
+    """Detect eye movement with improved accuracy and reduced false positives
     
-    # Store this normalized gaze with timestamp
-    current_pos = (normalized_gaze, current_time)
-    eye_pos_history.append(current_pos)
+    lm is the (N, 3) Face Mesh landmark array from lm_to_np, current_time the
+    frame's capture time in seconds.
+    """
     
-    # Keep history within size limit
-    if len(eye_pos_history) > EYE_POS_HISTORY_SIZE:
-        eye_pos_history.pop(0)
+    gaze_h, gaze_v, eye_scale = _compute_gaze(lm, GAZE_IDX, state.face_basis)
+    
+    # Store this normalized gaze with timestamp
+    idx = state.eye_pos_head
+    state.eye_pos_buf[idx, 0] = gaze_h
+    state.eye_pos_buf[idx, 1] = gaze_v
+    state.eye_t_buf[idx] = current_time
+    state.eye_pos_head = (idx + 1) % EYE_POS_HISTORY_SIZE  # Overwrites the oldest entry once full
+    state.eye_pos_len = min(state.eye_pos_len + 1, EYE_POS_HISTORY_SIZE)
     
     # IMPROVED: More adaptive threshold calculation
     # Dynamically adjust threshold based on recent eye movement patterns
-    if len(eye_pos_history) >= 5:  # Need fewer samples for quicker adaptation
-        # Calculate the average movement in recent history for baseline
-        movements = []
-        for i in range(1, len(eye_pos_history)):
-            prev_pos = eye_pos_history[i-1][0]
-            curr_pos = eye_pos_history[i][0]
-            movements.append(np.linalg.norm(curr_pos - prev_pos))
+    if state.eye_pos_len >= 5 and state.eye_baseline_age % BASELINE_REFRESH_FRAMES != 0:
+        # Reuse the baseline fitted a few frames ago
+        state.eye_baseline_age += 1
+    elif state.eye_pos_len >= 5:  # Need fewer samples for quicker adaptation
+        state.eye_baseline_age = 1
+        # Calculate the movement between consecutive frames in recent history for baseline
+        d = np.diff(ring_ordered(state.eye_pos_buf, state.eye_pos_head, state.eye_pos_len), axis=0)
+        movements = np.sqrt(np.einsum('ij,ij->i', d, d))
         
         # More sophisticated noise estimation:
         # Use 60th percentile as baseline for normal movement (was 70th)
-        movements.sort()
-        noise_level = movements[int(len(movements) * 0.6)]
+        k = int(len(movements) * 0.6)
+        noise_level = np.partition(movements, k)[k]
         
         # Lower multiplier for more sensitivity (was 3.0)
         # But keep a reasonable minimum to avoid false positives
-        eye_movement_baseline = max(0.01, noise_level * 2.2)
+        state.eye_movement_baseline = max(0.01, noise_level * 2.2)
     else:
         # More sensitive default (was 0.15)
-        eye_movement_baseline = 0.01
+        state.eye_movement_baseline = 0.01
     
     # Detect movement with improved sensitivity
-    if last_eye_pos is not None:
+    if state.last_eye_pos is not None:
         # Euclidean distance from last position
-        dist = np.linalg.norm(current_pos[0] - last_eye_pos)
+        dist = math.hypot(gaze_h - state.last_eye_pos[0], gaze_v - state.last_eye_pos[1])
         
         # Print diagnostic info if in debug mode
-        if DEBUG_MODE:
-            print(f"Eye movement: {dist:.5f}, Threshold: {eye_movement_baseline:.5f}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Eye movement: %.5f, Threshold: %.5f", dist, state.eye_movement_baseline)
         
         # IMPROVED: More sensitive detection with shorter debounce time
         # We want to detect more subtle eye movements
-        if dist > eye_movement_baseline and (current_time - last_significant_movement_time) > 0.3:  # Was 0.5s
+        if dist > state.eye_movement_baseline and (current_time - state.last_significant_movement_time) > 0.3:  # Was 0.5s
             # IMPROVED: Less strict sustained movement requirement
             # Now we only need moderate movement in the previous frame
-            if len(eye_pos_history) >= 3:
-                prev_dist = np.linalg.norm(eye_pos_history[-2][0] - eye_pos_history[-3][0])
-                if prev_dist > eye_movement_baseline * 0.5:  # Was 0.7
-                    eye_movement_count += 1
-                    last_significant_movement_time = current_time
-                    print(f"Significant eye movement detected! Count: {eye_movement_count}")
+            if state.eye_pos_len >= 3:
+                prev_pos = state.eye_pos_buf[(state.eye_pos_head - 2) % EYE_POS_HISTORY_SIZE]
+                prev_prev_pos = state.eye_pos_buf[(state.eye_pos_head - 3) % EYE_POS_HISTORY_SIZE]
+                prev_dist = math.hypot(prev_pos[0] - prev_prev_pos[0], prev_pos[1] - prev_prev_pos[1])
+                if prev_dist > state.eye_movement_baseline * 0.5:  # Was 0.7
+                    state.eye_movement_count += 1
+                    state.last_significant_movement_time = current_time
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Significant eye movement detected! Count: %d", state.eye_movement_count)
     
     # IMPROVED: Add pattern-based detection for saccades (quick eye movements)
     # This catches rapid movements that might be missed by the main algorithm
-    if len(eye_pos_history) >= 4:
-        # Calculate movement velocities
+    if state.eye_pos_len >= 4:
+        # Calculate movement velocities, newest first
         velocities = []
-        for i in range(1, min(4, len(eye_pos_history))):
-            time_diff = eye_pos_history[-i][1] - eye_pos_history[-(i+1)][1]
+        for i in range(1, 4):
+            curr_idx = (state.eye_pos_head - i) % EYE_POS_HISTORY_SIZE
+            prev_idx = (state.eye_pos_head - i - 1) % EYE_POS_HISTORY_SIZE
+            time_diff = state.eye_t_buf[curr_idx] - state.eye_t_buf[prev_idx]
             if time_diff > 0:
-                dist = np.linalg.norm(eye_pos_history[-i][0] - eye_pos_history[-(i+1)][0])
+                curr_pos = state.eye_pos_buf[curr_idx]
+                prev_pos = state.eye_pos_buf[prev_idx]
+                dist = math.hypot(curr_pos[0] - prev_pos[0], curr_pos[1] - prev_pos[1])
                 velocities.append(dist/time_diff)
         
         # If we see a spike in velocity (characteristic of saccades)
         if len(velocities) >= 2 and velocities[0] > 0.5 and velocities[0] > 2.0*velocities[1]:
-            if (current_time - last_significant_movement_time) > 0.3:  # Debounce
-                eye_movement_count += 1
-                last_significant_movement_time = current_time
-                print(f"Saccade detected! Count: {eye_movement_count}")
-    
-    last_eye_pos = current_pos[0]
-    return eye_movement_count
+            if (current_time - state.last_significant_movement_time) > 0.3:  # Debounce
+                state.eye_movement_count += 1
+                state.last_significant_movement_time = current_time
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Saccade detected! Count: %d", state.eye_movement_count)
+    
+    state.last_eye_pos = (gaze_h, gaze_v)
+    return state.eye_movement_count
 
 # Posture detection variables
-last_posture_vector = None
-posture_history = []  # Store recent posture vectors
 POSTURE_HISTORY_SIZE = 15
-last_significant_posture_time = 0
+# Only the most stable components (spine and shoulder angles) of each posture vector are kept
+POSTURE_STABLE_FEATURES = 2
 POSTURE_DEBOUNCE_TIME = 0.5  # Seconds to wait between counting posture changes
-posture_baseline_diff = 0.05  # Default threshold, will be adjusted dynamically
+INV_SQRT2 = 1 / math.sqrt(2)
 
-def detect_posture_change(pose_landmarks):
-    """Detect posture changes with improved accuracy and reduced false positives"""
-    global posture_change_count, last_posture, last_posture_vector, session_data
-    global posture_history, last_significant_posture_time, posture_baseline_diff
-    
-    current_time = time.time()
-    
-    if pose_landmarks is None:
-        session_data["posture_states"]["away"] += 1
-        return posture_change_count
+# Pose landmark indices, resolved once instead of through the enum on every frame
+LM_NOSE = mp_pose.PoseLandmark.NOSE.value
+LM_LEFT_EAR = mp_pose.PoseLandmark.LEFT_EAR.value
+LM_RIGHT_EAR = mp_pose.PoseLandmark.RIGHT_EAR.value
+LM_LEFT_SHOULDER = mp_pose.PoseLandmark.LEFT_SHOULDER.value
+LM_RIGHT_SHOULDER = mp_pose.PoseLandmark.RIGHT_SHOULDER.value
+LM_LEFT_HIP = mp_pose.PoseLandmark.LEFT_HIP.value
+LM_RIGHT_HIP = mp_pose.PoseLandmark.RIGHT_HIP.value
+
+@dataclass(slots=True)
+class TrackingState:
+    """Everything the detectors track for the current session
+    
+    The detectors take this as a parameter instead of reading module globals.
+    reset_tracking_vars swaps in a fresh instance.
+    """
+    # Counters
+    blink_count: int = 0
+    eye_movement_count: int = 0
+    posture_change_count: int = 0
+    
+    # Blink detection: ring buffers of recent EAR values and their timestamps.
+    # Landmark math is float32; timestamps stay float64 since epoch seconds need the precision.
+    ear_buf: np.ndarray = field(default_factory=lambda: np.empty(EAR_HISTORY_SIZE, dtype=np.float32))
+    t_buf: np.ndarray = field(default_factory=lambda: np.empty(EAR_HISTORY_SIZE, dtype=np.float64))
+    ear_head: int = 0  # Next write position
+    ear_len: int = 0   # Number of valid entries
+    blink_state: np.ndarray = field(default_factory=new_blink_state)
+    
+    # Eye movement detection: ring buffers of recent normalized gaze positions and their timestamps
+    last_eye_pos: tuple = None
+    face_basis: np.ndarray = field(default_factory=new_face_basis)
+    eye_pos_buf: np.ndarray = field(default_factory=lambda: np.empty((EYE_POS_HISTORY_SIZE, 2), dtype=np.float32))
+    eye_t_buf: np.ndarray = field(default_factory=lambda: np.empty(EYE_POS_HISTORY_SIZE, dtype=np.float64))
+    eye_pos_head: int = 0
+    eye_pos_len: int = 0
+    last_significant_movement_time: float = 0
+    eye_movement_baseline: float = 0.01  # Much lower default threshold for better sensitivity
+    eye_baseline_age: int = 0  # Frames since eye_movement_baseline was last refit
+    
+    # Posture detection: ring buffer of the stable components of recent posture vectors
+    last_posture: str = None
+    last_posture_vector: np.ndarray = None
+    posture_buf: np.ndarray = field(default_factory=lambda: np.empty((POSTURE_HISTORY_SIZE, POSTURE_STABLE_FEATURES), dtype=np.float32))
+    posture_head: int = 0
+    posture_len: int = 0
+    last_significant_posture_time: float = 0
+    posture_baseline_diff: float = 0.05  # Default threshold, will be adjusted dynamically
+    posture_baseline_age: int = 0  # Frames since posture_baseline_diff was last refit
+    
+    # Per-frame classification counters, indexed by the EXPRESSION_* / POSTURE_* constants
+    expression_counts: np.ndarray = field(default_factory=lambda: np.zeros(len(EXPRESSION_NAMES), dtype=np.int64))
+    posture_counts: np.ndarray = field(default_factory=lambda: np.zeros(len(POSTURE_STATE_NAMES), dtype=np.int64))
+    
+    clock: SessionClock = field(default_factory=SessionClock)
+    
+    # Motion gate: thumbnail of the previous frame, and what the last Pose frame
+    # added to posture_counts, which is counted again for frames that skip Pose
+    prev_thumb: np.ndarray = None
+    frames_since_pose: int = 0
+    last_posture_counts: np.ndarray = field(default_factory=lambda: np.zeros(len(POSTURE_STATE_NAMES), dtype=np.int64))
+    
+    # Last attentiveness score and the counters it was computed from
+    score_key: tuple = None
+    score: float = None
+    
+    # Held while a request runs its frames through the session
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+STATE = TrackingState()
+
+def detect_posture_change(landmarks, state, current_time):
+    """Detect posture changes with improved accuracy and reduced false positives
     
-    # Extract key landmarks for posture
-    landmarks = []
-    for landmark in pose_landmarks.landmark:
-        landmarks.append([landmark.x, landmark.y, landmark.z])
+    landmarks is the (33, 3) Pose landmark array from lm_to_np, or None when
+    no person was found in the frame. current_time is the frame's capture time
+    in seconds.
+    """
     
-    landmarks = np.array(landmarks)
+    if landmarks is None:
+        state.posture_counts[POSTURE_AWAY] += 1
+        return state.posture_change_count
     
     # Get more comprehensive landmarks for better posture detection
-    left_shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-    right_shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value]
-    left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP.value]
-    right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value]
-    left_ear = landmarks[mp_pose.PoseLandmark.LEFT_EAR.value] if mp_pose.PoseLandmark.LEFT_EAR.value < len(landmarks) else None
-    right_ear = landmarks[mp_pose.PoseLandmark.RIGHT_EAR.value] if mp_pose.PoseLandmark.RIGHT_EAR.value < len(landmarks) else None
-    nose = landmarks[mp_pose.PoseLandmark.NOSE.value] if mp_pose.PoseLandmark.NOSE.value < len(landmarks) else None
+    left_shoulder = landmarks[LM_LEFT_SHOULDER]
+    right_shoulder = landmarks[LM_RIGHT_SHOULDER]
+    left_hip = landmarks[LM_LEFT_HIP]
+    right_hip = landmarks[LM_RIGHT_HIP]
+    left_ear = landmarks[LM_LEFT_EAR] if LM_LEFT_EAR < len(landmarks) else None
+    right_ear = landmarks[LM_RIGHT_EAR] if LM_RIGHT_EAR < len(landmarks) else None
+    nose = landmarks[LM_NOSE] if LM_NOSE < len(landmarks) else None
     
     # Calculate centers
     shoulder_center = (left_shoulder + right_shoulder) / 2
@@ -581,9 +985,9 @@ def detect_posture_change(pose_landmarks):
     # Calculate shoulder tilt (left-right lean)
     shoulder_tilt = left_shoulder - right_shoulder
     
-    # Calculate posture angles
-    spine_angle = np.arctan2(spine_vector[1], spine_vector[0])
-    shoulder_tilt_angle = np.arctan2(shoulder_tilt[1], shoulder_tilt[0])
+    # Calculate posture angles (scalar math module calls, no ufunc dispatch)
+    spine_angle = math.atan2(spine_vector[1], spine_vector[0])
+    shoulder_tilt_angle = math.atan2(shoulder_tilt[1], shoulder_tilt[0])
     
     # Get depth info (z-axis) for 3D posture analysis
     if head_forward_vector is not None:
@@ -599,227 +1003,363 @@ def detect_posture_change(pose_landmarks):
     
     # Add head forward lean if available
     if head_forward_vector is not None:
-        head_angle = np.arctan2(head_forward_vector[1], head_forward_vector[0])
+        head_angle = math.atan2(head_forward_vector[1], head_forward_vector[0])
         posture_features.append(head_angle)
         posture_features.append(head_forward_z)
     
     # Create final posture vector with all features
-    posture_vector = np.array(posture_features)
+    posture_vector = np.array(posture_features, dtype=np.float32)
     
-    # Store posture with timestamp to history
-    posture_history.append((posture_vector, current_time))
-    
-    # Keep history within size limit
-    if len(posture_history) > POSTURE_HISTORY_SIZE:
-        posture_history.pop(0)
+    # Store the most stable components of the vector to history to avoid noise
+    idx = state.posture_head
+    state.posture_buf[idx] = posture_vector[:POSTURE_STABLE_FEATURES]  # Use spine and shoulder angles
+    state.posture_head = (idx + 1) % POSTURE_HISTORY_SIZE  # Overwrites the oldest entry once full
+    state.posture_len = min(state.posture_len + 1, POSTURE_HISTORY_SIZE)
     
     # If we have enough history, adapt the posture difference threshold
-    if len(posture_history) >= 7:
-        # Calculate the average posture differences in recent history for baseline
-        differences = []
-        for i in range(1, len(posture_history)):
-            prev_pos = posture_history[i-1][0]
-            curr_pos = posture_history[i][0]
-            # Use only the most stable components of the vector to avoid noise
-            stable_prev = prev_pos[:2]  # Use spine and shoulder angles
-            stable_curr = curr_pos[:2]
-            differences.append(np.linalg.norm(stable_curr - stable_prev))
-        
-        # Sort differences
-        differences.sort()
+    if state.posture_len >= 7 and state.posture_baseline_age % BASELINE_REFRESH_FRAMES != 0:
+        # Reuse the baseline fitted a few frames ago
+        state.posture_baseline_age += 1
+    elif state.posture_len >= 7:
+        state.posture_baseline_age = 1
+        # Calculate the posture differences between consecutive frames for baseline
+        d = np.diff(ring_ordered(state.posture_buf, state.posture_head, state.posture_len), axis=0)
+        differences = np.sqrt((d * d).sum(axis=1))
         
         # Set baseline as the 70th percentile of differences (above normal movements)
         index = int(len(differences) * 0.7)
         if index < len(differences):
-            noise_level = differences[index]
+            noise_level = np.partition(differences, index)[index]
             # Set threshold as 1.5x the noise level
-            posture_baseline_diff = max(0.05, noise_level * 1.5)
+            state.posture_baseline_diff = max(0.05, noise_level * 1.5)
     
     # Determine posture state with more precise thresholds
     # Using spine angle for basic classification
     if abs(spine_angle) < 0.12:  # Nearly vertical
         current_posture = "upright"
-        session_data["posture_states"]["upright"] += 1
+        state.posture_counts[POSTURE_UPRIGHT] += 1
     elif spine_angle < 0:  # Leaning forward (negative angle in screen coordinates)
         # Check degree of forward lean
         if spine_angle < -0.3:  # Significant forward lean
             current_posture = "leaning_forward"
         else:
             current_posture = "slight_forward"
-        session_data["posture_states"]["leaning_forward"] += 1
+        state.posture_counts[POSTURE_LEANING_FORWARD] += 1
     else:  # Leaning back (positive angle in screen coordinates)
         current_posture = "slouching"
-        session_data["posture_states"]["slouching"] += 1
+        state.posture_counts[POSTURE_SLOUCHING] += 1
     
     # Additional posture refinement using head position if available
     if head_forward_vector is not None:
-        head_forward_angle = np.arctan2(head_forward_vector[1], head_forward_vector[0])
         # If head is tilted down significantly, this could be looking at phone/desk
-        if head_forward_angle < -0.25:
+        if head_angle < -0.25:
             current_posture = "looking_down"
-            session_data["posture_states"]["leaning_forward"] += 1
+            state.posture_counts[POSTURE_LEANING_FORWARD] += 1
     
     # Print diagnostic information
-    print(f"Posture: {current_posture}, Spine angle: {spine_angle:.3f}, Threshold: {posture_baseline_diff:.3f}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Posture: %s, Spine angle: %.3f, Threshold: %.3f",
+                     current_posture, spine_angle, state.posture_baseline_diff)
     
     # Check if posture has changed significantly
     posture_changed = False
     
     # First check if the posture state category changed
-    if last_posture is not None and current_posture != last_posture:
+    if state.last_posture is not None and current_posture != state.last_posture:
         # Only count significant state changes and use debounce
-        if (current_time - last_significant_posture_time) > POSTURE_DEBOUNCE_TIME:
+        if (current_time - state.last_significant_posture_time) > POSTURE_DEBOUNCE_TIME:
             posture_changed = True
-            posture_change_count += 1
-            last_significant_posture_time = current_time
-            print(f"Posture state changed from {last_posture} to {current_posture}. Count: {posture_change_count}")
-    # Then check for subtle but significant changes using vector comparison
-    elif last_posture_vector is not None:
-        # Use only the most stable components of the vector to calculate differences
-        stable_last = last_posture_vector[:2] if len(last_posture_vector) >= 2 else last_posture_vector
-        stable_current = posture_vector[:2] if len(posture_vector) >= 2 else posture_vector
+            state.posture_change_count += 1
+            state.last_significant_posture_time = current_time
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Posture state changed from %s to %s. Count: %d",
+                             state.last_posture, current_posture, state.posture_change_count)
+    # Then check for subtle but significant changes using vector comparison.
+    # Only count significant changes with debounce time, so the difference is
+    # not even computed while a recent change is being debounced.
+    elif (state.last_posture_vector is not None and
+          (current_time - state.last_significant_posture_time) > POSTURE_DEBOUNCE_TIME):
+        # Use only the most stable components of the vector to calculate differences.
+        # Posture vectors always start with the spine and shoulder angles.
+        stable_last = state.last_posture_vector
+        d_spine = float(posture_vector[0] - stable_last[0])
+        d_shoulder = float(posture_vector[1] - stable_last[1])
+        threshold = state.posture_baseline_diff
         
-        # Calculate the difference
-        posture_diff = np.linalg.norm(stable_current - stable_last)
-        
-        # Only count significant changes with debounce time
-        if (posture_diff > posture_baseline_diff and 
-            (current_time - last_significant_posture_time) > POSTURE_DEBOUNCE_TIME):
-            posture_changed = True
-            posture_change_count += 1
-            last_significant_posture_time = current_time
-            print(f"Subtle posture change detected! Diff: {posture_diff:.3f}, Count: {posture_change_count}")
-    
-    last_posture = current_posture
-    last_posture_vector = posture_vector
-    return posture_change_count
+        # The difference can only exceed the threshold if one of its components
+        # exceeds threshold / sqrt(2), so the usual small frame-to-frame jitter
+        # is ruled out without computing the norm
+        if max(abs(d_spine), abs(d_shoulder)) > threshold * INV_SQRT2:
+            posture_diff = math.hypot(d_spine, d_shoulder)
+            if posture_diff > threshold:
+                posture_changed = True
+                state.posture_change_count += 1
+                state.last_significant_posture_time = current_time
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Subtle posture change detected! Diff: %.3f, Count: %d",
+                                 posture_diff, state.posture_change_count)
+    
+    state.last_posture = current_posture
+    state.last_posture_vector = posture_vector
+    return state.posture_change_count
 
-def detect_facial_expression(landmarks):
-    """Estimate facial expression based on landmark positions with improved accuracy"""
-    global session_data, eye_movement_count
-    
-    # Extract features for expression detection
+# Face Mesh landmarks read by the expression kernel, in the order it expects them
+EXPR_IDX = np.array([
+    285, 55, 282, 52,  # Left/right inner eyebrow, left/right outer eyebrow
+    159, 386,          # Left/right upper eyelid
+    145, 374,          # Left/right lower eyelid
+    13, 14,            # Upper and lower lip
+    61, 291,           # Left and right mouth corner
+], dtype=np.int32)
+
+@njit(cache=True, fastmath=True)
+def _expr_features(lm, idx):
+    """Compute the expression features from the landmark array
+    
+    idx is EXPR_IDX. Only y coordinates are used, read as float64.
+    Returns (eyebrow_to_eye_distance, eyebrow_furrow, mouth_distance,
+    smile_metric, eye_openness).
+    """
     # Get eyebrow positions (for concentration detection)
-    left_inner_eyebrow = landmarks[285].y
-    right_inner_eyebrow = landmarks[55].y
-    left_outer_eyebrow = landmarks[282].y
-    right_outer_eyebrow = landmarks[52].y
+    left_inner_eyebrow = float(lm[idx[0], 1])
+    right_inner_eyebrow = float(lm[idx[1], 1])
+    left_outer_eyebrow = float(lm[idx[2], 1])
+    right_outer_eyebrow = float(lm[idx[3], 1])
+    left_eye_top = float(lm[idx[4], 1])
+    right_eye_top = float(lm[idx[5], 1])
+    left_eye_bottom = float(lm[idx[6], 1])
+    right_eye_bottom = float(lm[idx[7], 1])
+    upper_lip = float(lm[idx[8], 1])
+    lower_lip = float(lm[idx[9], 1])
+    left_mouth_corner = float(lm[idx[10], 1])
+    right_mouth_corner = float(lm[idx[11], 1])
     
     # Check eyebrow position relative to eye position
-    left_eye_top = landmarks[159].y
-    right_eye_top = landmarks[386].y
     eyebrow_to_eye_distance = ((left_inner_eyebrow - left_eye_top) + (right_inner_eyebrow - right_eye_top)) / 2
     
     # Check for furrowed brows (concentration)
     eyebrow_furrow = abs((left_inner_eyebrow - left_outer_eyebrow) - (right_inner_eyebrow - right_outer_eyebrow))
     
     # Check mouth (open or closed) with improved points
-    upper_lip = landmarks[13].y
-    lower_lip = landmarks[14].y
     mouth_distance = abs(upper_lip - lower_lip)
     
     # Check for smile using mouth corners
-    left_mouth_corner = landmarks[61].y
-    right_mouth_corner = landmarks[291].y
-    center_mouth = landmarks[13].y
+    center_mouth = upper_lip
     smile_metric = ((left_mouth_corner - center_mouth) + (right_mouth_corner - center_mouth)) / 2
     
     # Check eyes squinting (for concentration)
-    left_eye_top_to_bottom = abs(landmarks[159].y - landmarks[145].y)
-    right_eye_top_to_bottom = abs(landmarks[386].y - landmarks[374].y)
+    left_eye_top_to_bottom = abs(left_eye_top - left_eye_bottom)
+    right_eye_top_to_bottom = abs(right_eye_top - right_eye_bottom)
     eye_openness = (left_eye_top_to_bottom + right_eye_top_to_bottom) / 2
+    return eyebrow_to_eye_distance, eyebrow_furrow, mouth_distance, smile_metric, eye_openness
+
+def detect_facial_expression(lm, state):
+    """Estimate facial expression based on landmark positions with improved accuracy
+    
+    lm is the (N, 3) Face Mesh landmark array from lm_to_np.
+    """
+    # Extract features for expression detection
+    eyebrow_to_eye_distance, eyebrow_furrow, mouth_distance, smile_metric, eye_openness = _expr_features(lm, EXPR_IDX)
     
     # More accurate expression detection
     if mouth_distance > 0.04:  # Open mouth
         if smile_metric > 0.01:  # Smiling with open mouth - engaged positively
-            session_data["facial_expressions"]["focused"] += 1
+            state.expression_counts[EXPRESSION_FOCUSED] += 1
             return "focused"
         else:  # Open mouth without smile - possibly confused/yawning
-            session_data["facial_expressions"]["confused"] += 1
+            state.expression_counts[EXPRESSION_CONFUSED] += 1
             return "confused"
     
     # Concentration indicators: raised eyebrows OR furrowed brow with squinted eyes
     elif (eyebrow_to_eye_distance > 0.025 or  # Raised eyebrows
           (eyebrow_furrow > 0.01 and eye_openness < 0.025)):  # Furrowed brow and squinted eyes
-        session_data["facial_expressions"]["focused"] += 1
+        state.expression_counts[EXPRESSION_FOCUSED] += 1
         return "focused"
     
     # Distraction indicators
-    elif eye_movement_count > 10 or (  # Frequent eye movements
+    elif state.eye_movement_count > 10 or (  # Frequent eye movements
           mouth_distance < 0.015 and smile_metric < 0.005):  # Tight-lipped
-        session_data["facial_expressions"]["distracted"] += 1
+        state.expression_counts[EXPRESSION_DISTRACTED] += 1
         return "distracted"
     
     # Neutral expression - default
     else:
-        session_data["facial_expressions"]["neutral"] += 1
+        state.expression_counts[EXPRESSION_NEUTRAL] += 1
         return "neutral"
 
+JPEG_SOI = b'\xff\xd8'  # Start-of-image marker every JPEG file begins with
+
+def decode_frame(frame_data, slot=0):
+    """Decode a frame into an RGB image at the model input size
+    
+    frame_data is either a base64 data URL string or the raw encoded image bytes.
+    slot picks the RGB buffer, see prepare_frame.
+    """
+    if isinstance(frame_data, str):
+        # Skip the "data:image/jpeg;base64," prefix without splitting the whole string.
+        # a2b_base64 reads the str directly, where b64decode would first copy it
+        # into an ASCII bytes object.
+        comma = frame_data.find(',')
+        image_data = binascii.a2b_base64(frame_data[comma + 1:])
+    else:
+        image_data = frame_data
+    if turbo_jpeg is not None and image_data[:2] == JPEG_SOI:
+        # Decode at half resolution when that still covers the model input
+        # width - libjpeg scales during the IDCT, which is cheaper than decoding
+        # the full frame and resizing it
+        width = turbo_jpeg.decode_header(image_data)[0]
+        scaling_factor = (1, 2) if width // 2 >= MODEL_INPUT_WIDTH else None
+        # Decoded straight to RGB, which saves the channel swap
+        frame = turbo_jpeg.decode(image_data, pixel_format=TJPF_RGB, scaling_factor=scaling_factor)
+        return prepare_frame(frame, slot, is_rgb=True)
+    
+    # Other formats (PNG, WebP) and missing TurboJPEG go through OpenCV. Its
+    # reduced decode modes can't be chosen by frame size, since imdecode doesn't
+    # report the size up front, so the frame is decoded in full.
+    nparr = np.frombuffer(image_data, np.uint8)
+    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("data is not a supported image format")
+    
+    # Shrink to the model input size and convert to RGB for MediaPipe
+    return prepare_frame(frame, slot)
+
+def queue_frame(rgb_frame, state):
+    """Queue a decoded frame for inference, returning (run_pose, future)"""
+    # Only run Pose when the frame moved, or when its last result got too old
+    thumb = motion_thumbnail(rgb_frame)
+    run_pose = (state.prev_thumb is None or
+                state.frames_since_pose >= POSE_REFRESH_FRAMES - 1 or
+                float(cv2.absdiff(thumb, state.prev_thumb).mean()) >= MOTION_EPS)
+    state.prev_thumb = thumb
+    if run_pose:
+        state.frames_since_pose = 0
+    else:
+        state.frames_since_pose += 1
+    return run_pose, queue_inference(rgb_frame, run_pose)
+
+class BadRequestData(Exception):
+    """Raised by the API endpoints when the request carries no usable data"""
+
 def process_frame(frame_data):
-    """Process a single video frame for attention tracking"""
-    global session_data
+    """Process a single video frame for attention tracking
     
-    # Decode base64 image
-    try:
-        image_data = base64.b64decode(frame_data.split(',')[1])
-        nparr = np.frombuffer(image_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    except Exception as e:
-        return {
-            "error": f"Failed to decode image: {str(e)}"
-        }
-    
-    # Convert to RGB for MediaPipe
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    
-    # Process with Face Mesh
-    face_mesh_results = face_mesh.process(rgb_frame)
-    
-    # Process with Pose
-    pose_results = pose.process(rgb_frame)
-    
-    current_time = time.time()
-    metrics = {
-        "timestamp": current_time,
-        "blink_detected": False,
-        "eye_movements": eye_movement_count,
-        "posture_changes": posture_change_count,
-        "expression": "neutral"
-    }
+    frame_data is either a base64 data URL string or the raw encoded image bytes.
+    The frame is timed by its arrival.
+    """
+    return process_frames([frame_data])[0]
+
+def process_frames(frames, timestamps=None):
+    """Process a batch of video frames in order, returning one result per frame
+    
+    timestamps holds each frame's capture time in seconds, never decreasing. The
+    detectors measure blink and eye velocities and their debounce intervals
+    between frames, so a batch sent at once needs them; without, each frame is
+    timed by its analysis. Only the spacing of the timestamps is used: they are
+    moved onto the server clock, which single frames are timed by, with the
+    last frame taken as captured when the batch is processed. Raises
+    BadRequestData if that would put the first frame before frames the session
+    has already processed.
+    
+    All frames are decoded and queued for inference before the first result is
+    awaited, so the inference worker gets the whole batch at once. The batch as a
+    whole waits at most INFERENCE_TIMEOUT; frames not done by then get an error.
+    """
+    state = STATE
+    
+    # Decode every frame first; a frame that fails keeps its error in its slot.
+    # Decoding only touches this thread's buffers, so it runs outside the lock.
+    decoded = []
+    for slot, frame_data in enumerate(frames):
+        try:
+            decoded.append(decode_frame(frame_data, slot))
+        except Exception as e:
+            decoded.append({
+                "error": f"Failed to decode image: {str(e)}"
+            })
+    
+    # The motion gate, the video-mode trackers and the detectors all depend on
+    # the order of the session's frames, so one request at a time runs them
+    with state.lock:
+        if timestamps is not None:
+            shift = time.time() - timestamps[-1]
+            timestamps = [t + shift for t in timestamps]
+            if state.clock.count and timestamps[0] < state.clock.last_time:
+                raise BadRequestData('Frames overlap with frames already processed')
+        
+        queued = [item if isinstance(item, dict) else queue_frame(item, state) for item in decoded]
+        
+        deadline = time.monotonic() + INFERENCE_TIMEOUT
+        results = []
+        for slot, item in enumerate(queued):
+            if isinstance(item, dict):
+                results.append(item)
+                continue
+            run_pose, future = item
+            try:
+                face_mesh_results, pose_results = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                # Inference may still read the frame later, so its buffer must not
+                # be overwritten by this thread's next request
+                future.cancel()
+                release_frame_buffer(slot)
+                results.append({
+                    "error": "Timed out waiting for inference"
+                })
+                continue
+            current_time = timestamps[slot] if timestamps is not None else time.time()
+            results.append(analyze_frame(face_mesh_results, pose_results, run_pose, state, current_time))
+    return results
+
+def analyze_frame(face_mesh_results, pose_results, run_pose, state, current_time):
+    """Update the tracking state with one frame's model results and return its metrics
+    
+    current_time is the frame's capture time in seconds.
+    """
+    blink_detected = False
+    expression = "neutral"
     
     # Process face mesh results
     if face_mesh_results.multi_face_landmarks:
-        landmarks = face_mesh_results.multi_face_landmarks[0].landmark
+        face_landmarks = face_mesh_results.multi_face_landmarks[0]
+        face_lm = lm_to_np(face_landmarks, "face", FACE_LANDMARK_COUNT)
         
         # Detect blink
-        metrics["blink_detected"] = detect_blink(landmarks)
+        blink_detected = detect_blink(face_lm, state, current_time)
         
         # Detect eye movement
-        metrics["eye_movements"] = detect_eye_movement(landmarks)
+        detect_eye_movement(face_lm, state, current_time)
         
         # Detect facial expression
-        metrics["expression"] = detect_facial_expression(landmarks)
-    
-    # Process pose results
-    if pose_results.pose_landmarks:
-        metrics["posture_changes"] = detect_posture_change(pose_results.pose_landmarks)
+        expression = detect_facial_expression(face_lm, state)
+    
+    # Process pose results (None when no person was found). Frames that skipped
+    # Pose have no new posture: feeding the old landmarks in again would add zero
+    # differences to the posture history and drag its adaptive threshold down,
+    # so the last posture is only counted again.
+    if run_pose:
+        pose_lm = (lm_to_np(pose_results.pose_landmarks, "pose", POSE_LANDMARK_COUNT)
+                   if pose_results.pose_landmarks else None)
+        counts_before = state.posture_counts.copy()
+        detect_posture_change(pose_lm, state, current_time)
+        np.subtract(state.posture_counts, counts_before, out=state.last_posture_counts)
     else:
-        metrics["posture_changes"] = detect_posture_change(None)
+        state.posture_counts += state.last_posture_counts
     
-    # Add metrics to session data
-    session_data["time_series"].append(metrics)
+    # Count the frame towards the session
+    state.clock.tick(current_time)
     
     # Calculate attentiveness score just for this frame
     current_attentiveness = 90  # Default score
     
     # Basic attentiveness calculation for real-time updates
-    if metrics["blink_detected"]:
+    if blink_detected:
         current_attentiveness -= 5
-    if eye_movement_count > 10:
+    if state.eye_movement_count > 10:
         current_attentiveness -= 10
-    if posture_change_count > 5:
+    if state.posture_change_count > 5:
         current_attentiveness -= 8
-    if metrics["expression"] == "distracted":
+    if expression == "distracted":
         current_attentiveness -= 15
     
     # Ensure score is between 0-100
@@ -827,76 +1367,89 @@ def process_frame(frame_data):
     
     # Return metrics with field names that match client-side expectations
     return {
-        "blink_count": blink_count,
-        "eye_movement_count": eye_movement_count,
-        "posture_change_count": posture_change_count,
+        "blink_count": state.blink_count,
+        "eye_movement_count": state.eye_movement_count,
+        "posture_change_count": state.posture_change_count,
         "attentiveness_score": current_attentiveness,
-        "facial_expression": metrics["expression"]
+        "facial_expression": expression
     }
 
-def calculate_attentiveness_score():
+# Normal ranges (per minute) for each metric used by the attentiveness score
+# For average adults, 15-20 blinks per minute is normal
+BLINK_RANGE = (8, 20)  # More lenient lower bound
+# 1-5 major eye movements per minute during focused work is reasonable
+EYE_RANGE = (1, 5)  # More lenient upper bound
+# 0-3 posture changes per minute during focused work is reasonable
+POSTURE_RANGE = (0, 3)  # More lenient upper bound
+
+def calculate_attentiveness_score(state):
+    """Return the overall attentiveness score, reusing the last one if no frame came in since
+    
+    Every processed frame ticks the session clock, so the counters below change
+    whenever the score can have changed.
+    """
+    key = (state.clock.count, state.blink_count, state.eye_movement_count, state.posture_change_count)
+    if key != state.score_key:
+        state.score = compute_attentiveness_score(state)
+        state.score_key = key
+    return state.score
+
+def compute_attentiveness_score(state):
     """Calculate an overall attentiveness score with improved accuracy"""
-    global session_data
+    clock = state.clock
+    # Plain int lists, so the sums below don't go through NumPy scalars
+    expressions = state.expression_counts.tolist()
+    postures = state.posture_counts.tolist()
     
     # Get total frames analyzed
-    total_frames = len(session_data["time_series"])
+    total_frames = clock.count
     if total_frames == 0:
         return 75  # Default score if no data - start with a positive assumption
     
     # Calculate focused time percentage from facial expressions
-    focused_frames = session_data["facial_expressions"]["focused"] + session_data["facial_expressions"]["neutral"]
+    focused_frames = expressions[EXPRESSION_FOCUSED] + expressions[EXPRESSION_NEUTRAL]
     focused_percentage = (focused_frames / total_frames) * 100
     
     # Consider leaning forward as acceptable posture for studying
     # This is a common posture when engaged in learning
-    good_posture_frames = session_data["posture_states"]["upright"] + (session_data["posture_states"]["leaning_forward"] * 0.7)
+    good_posture_frames = postures[POSTURE_UPRIGHT] + (postures[POSTURE_LEANING_FORWARD] * 0.7)
     good_posture_percentage = min(100, (good_posture_frames / total_frames) * 100)
     
     # Determine session duration in seconds
-    if len(session_data["time_series"]) >= 2:
-        first_timestamp = session_data["time_series"][0]["timestamp"]
-        last_timestamp = session_data["time_series"][-1]["timestamp"]
-        session_duration = max(1, last_timestamp - first_timestamp)  # Ensure at least 1 second
+    if total_frames >= 2:
+        session_duration = max(1, clock.duration())  # Ensure at least 1 second
     else:
         session_duration = 1  # Default to 1 second
     
     # Calculate normalized metrics per minute for fair scoring
     safe_duration = max(session_duration, 0.1)  # Protect against division by zero
-    normalized_blinks = (blink_count / safe_duration) * 60  # Blinks per minute
-    normalized_eye_movements = (eye_movement_count / safe_duration) * 60  # Eye movements per minute
-    normalized_posture_changes = (posture_change_count / safe_duration) * 60  # Posture changes per minute
-    
-    # Define normal ranges for each metric
-    # For average adults, 15-20 blinks per minute is normal
-    normal_blinks_range = (8, 20)  # More lenient lower bound
-    # 1-5 major eye movements per minute during focused work is reasonable
-    normal_eye_movements_range = (1, 5)  # More lenient upper bound
-    # 0-3 posture changes per minute during focused work is reasonable
-    normal_posture_changes_range = (0, 3)  # More lenient upper bound
+    normalized_blinks = (state.blink_count / safe_duration) * 60  # Blinks per minute
+    normalized_eye_movements = (state.eye_movement_count / safe_duration) * 60  # Eye movements per minute
+    normalized_posture_changes = (state.posture_change_count / safe_duration) * 60  # Posture changes per minute
     
     # Calculate penalties with reduced weights
     # Blink penalties
-    if normalized_blinks < normal_blinks_range[0]:  # Too few blinks (staring)
-        blink_penalty = min(15, 3 + (normal_blinks_range[0] - normalized_blinks) * 0.8)
-    elif normalized_blinks > normal_blinks_range[1]:  # Too many blinks
-        blink_penalty = min(15, (normalized_blinks - normal_blinks_range[1]) * 0.7)
+    if normalized_blinks < BLINK_RANGE[0]:  # Too few blinks (staring)
+        blink_penalty = min(15, 3 + (BLINK_RANGE[0] - normalized_blinks) * 0.8)
+    elif normalized_blinks > BLINK_RANGE[1]:  # Too many blinks
+        blink_penalty = min(15, (normalized_blinks - BLINK_RANGE[1]) * 0.7)
     else:
         blink_penalty = 0
     
     # Penalty for excessive eye movements (distraction)
-    if normalized_eye_movements > normal_eye_movements_range[1]:
-        eye_movement_penalty = min(20, (normalized_eye_movements - normal_eye_movements_range[1]) * 2.0)
+    if normalized_eye_movements > EYE_RANGE[1]:
+        eye_movement_penalty = min(20, (normalized_eye_movements - EYE_RANGE[1]) * 2.0)
     else:
         eye_movement_penalty = 0
     
     # Penalty for excessive posture changes (fidgeting)
-    if normalized_posture_changes > normal_posture_changes_range[1]:
-        posture_penalty = min(10, (normalized_posture_changes - normal_posture_changes_range[1]) * 3.0)
+    if normalized_posture_changes > POSTURE_RANGE[1]:
+        posture_penalty = min(10, (normalized_posture_changes - POSTURE_RANGE[1]) * 3.0)
     else:
         posture_penalty = 0
     
     # Distraction penalty from facial expressions - reduced impact
-    distracted_frames = session_data["facial_expressions"]["distracted"] + session_data["facial_expressions"]["confused"]
+    distracted_frames = expressions[EXPRESSION_DISTRACTED] + expressions[EXPRESSION_CONFUSED]
     distraction_percentage = (distracted_frames / total_frames) * 100
     distraction_penalty = min(25, distraction_percentage * 0.3)
     
@@ -911,45 +1464,136 @@ def calculate_attentiveness_score():
         adjusted_score = max(adjusted_score, 60)  # Minimum score of 60 for very short sessions
     
     # Print detailed scoring information for debugging
-    print(f"Attentiveness Score Details:")
-    print(f"  Session duration: {session_duration:.1f} seconds")
-    print(f"  Metrics: Blinks={normalized_blinks:.1f}/min, Eye Movements={normalized_eye_movements:.1f}/min, Posture Changes={normalized_posture_changes:.1f}/min")
-    print(f"  Base Score: {base_score:.2f} (Focus: {focused_percentage:.1f}%, Good Posture: {good_posture_percentage:.1f}%)")
-    print(f"  Penalties - Blinks: {blink_penalty:.2f}, Eye Movements: {eye_movement_penalty:.2f}")
-    print(f"  Penalties - Posture: {posture_penalty:.2f}, Distraction: {distraction_penalty:.2f}")
-    print(f"  Final Score: {adjusted_score:.2f}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Attentiveness Score Details:")
+        logger.debug("  Session duration: %.1f seconds", session_duration)
+        logger.debug("  Metrics: Blinks=%.1f/min, Eye Movements=%.1f/min, Posture Changes=%.1f/min",
+                     normalized_blinks, normalized_eye_movements, normalized_posture_changes)
+        logger.debug("  Base Score: %.2f (Focus: %.1f%%, Good Posture: %.1f%%)",
+                     base_score, focused_percentage, good_posture_percentage)
+        logger.debug("  Penalties - Blinks: %.2f, Eye Movements: %.2f", blink_penalty, eye_movement_penalty)
+        logger.debug("  Penalties - Posture: %.2f, Distraction: %.2f", posture_penalty, distraction_penalty)
+        logger.debug("  Final Score: %.2f", adjusted_score)
     
     # Ensure score is between 0-100
     return max(0, min(100, adjusted_score))
 
+def warm_up_kernels():
+    """Run every compiled kernel once on dummy data
+    
+    Compiles them (or loads them from Numba's cache) at startup, with the
+    argument types used per frame, so the first request doesn't pay for it.
+    """
+    face = np.zeros((FACE_LANDMARK_COUNT, 3), dtype=np.float32)
+    _compute_gaze(face, GAZE_IDX, new_face_basis())
+    _expr_features(face, EXPR_IDX)
+    ear = np.zeros(EAR_HISTORY_SIZE, dtype=np.float32)
+    t = np.zeros(EAR_HISTORY_SIZE, dtype=np.float64)
+    _blink_step(ear, t, 1, 1, new_blink_state())
+
+warm_up_kernels()
+
+def json_response(obj):
+    """Build a JSON response, encoding obj once with dumps_json"""
+    return app.response_class(dumps_json(obj), mimetype='application/json')
+
 @app.route('/process_frame', methods=['POST'])
 def api_process_frame():
-    """API endpoint to process a single video frame"""
-    if 'frame' not in request.json:
-        return jsonify({'error': 'No frame data provided'}), 400
+    """API endpoint to process a single video frame
+    
+    Accepts either JSON with a base64 data URL in "frame", or a multipart
+    upload with the raw JPEG in a "frame" file, which skips base64 entirely.
+    """
+    # A malformed JSON body comes back as None instead of raising
+    body = request.get_json(silent=True)
+    if 'frame' in request.files:
+        frame_data = request.files['frame'].read()
+    elif isinstance(body, dict) and 'frame' in body:
+        frame_data = body['frame']
+    else:
+        raise BadRequestData('No frame data provided')
     
-    frame_data = request.json['frame']
     results = process_frame(frame_data)
     
-    return jsonify(results)
+    return json_response(results)
+
+def parse_timestamps(values, count):
+    """Turn the "timestamps" of a request (milliseconds) into a list of seconds
+    
+    Raises BadRequestData unless there is one finite number per frame and they
+    never decrease. Multipart uploads send them as strings.
+    """
+    if not isinstance(values, list) or len(values) != count:
+        raise BadRequestData('Expected one capture time per frame in "timestamps"')
+    
+    timestamps = []
+    for value in values:
+        seconds = math.nan
+        if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+            try:
+                seconds = float(value) / 1000
+            except (ValueError, OverflowError):
+                pass
+        if not math.isfinite(seconds):
+            raise BadRequestData('Capture times in "timestamps" must be finite numbers')
+        if timestamps and seconds < timestamps[-1]:
+            raise BadRequestData('Capture times in "timestamps" must not decrease')
+        timestamps.append(seconds)
+    return timestamps
+
+@app.route('/process_frames', methods=['POST'])
+def api_process_frames():
+    """API endpoint to process several video frames in one request
+    
+    Accepts JSON with a list of base64 data URLs in "frames", or a multipart
+    upload with one "frames" file per raw JPEG. "timestamps" gives each frame's
+    capture time in milliseconds since the epoch (as from Date.now()). It is
+    required for more than one frame, since frames posted together can't be
+    timed by their arrival. Frames are processed in the order given and the
+    response holds one result per frame.
+    """
+    # A malformed JSON body comes back as None instead of raising
+    body = request.get_json(silent=True)
+    if 'frames' in request.files:
+        frames = [f.read() for f in request.files.getlist('frames')]
+        timestamps = request.form.getlist('timestamps')
+    elif isinstance(body, dict) and isinstance(body.get('frames'), list):
+        frames = body['frames']
+        timestamps = body.get('timestamps')
+    else:
+        raise BadRequestData('No frame data provided')
+    
+    if len(frames) > MAX_BATCH_FRAMES:
+        raise BadRequestData(f'At most {MAX_BATCH_FRAMES} frames per request')
+    
+    if timestamps or len(frames) > 1:
+        timestamps = parse_timestamps(timestamps, len(frames))
+    else:
+        timestamps = None
+    
+    results = process_frames(frames, timestamps)
+    
+    return json_response({"results": results})
 
 @app.route('/get_tracking_results', methods=['GET'])
 def api_get_tracking_results():
     """API endpoint to get accumulated tracking results"""
-    attentiveness_score = calculate_attentiveness_score()
+    state = STATE
+    attentiveness_score = calculate_attentiveness_score(state)
     
     # Format the response to match the client's expected structure
     results = {
-        "eyeBlinks": blink_count,
-        "eyeMovements": eye_movement_count,
-        "postureChanges": posture_change_count,
+        "eyeBlinks": state.blink_count,
+        "eyeMovements": state.eye_movement_count,
+        "postureChanges": state.posture_change_count,
         "attentivenessScore": attentiveness_score,
-        "facialExpressions": session_data["facial_expressions"],
-        "postureStates": session_data["posture_states"],
-        "sessionData": json.dumps(session_data)
+        "facialExpressions": counts_to_dict(state.expression_counts, EXPRESSION_NAMES),
+        "postureStates": counts_to_dict(state.posture_counts, POSTURE_STATE_NAMES),
+        # The client expects the session data as a JSON string it parses itself
+        "sessionData": dumps_json(session_snapshot(state)).decode()
     }
     
-    return jsonify(results)
+    return json_response(results)
 
 @app.route('/reset_tracking', methods=['POST'])
 def api_reset_tracking():
@@ -963,6 +1607,24 @@ def health_check():
     return jsonify({"status": "Tracking service is running"})
 
 # Add better error handling for all Flask routes
+@app.errorhandler(BadRequestData)
+def handle_bad_request_data(e):
+    """Handler for requests whose data can't be used
+    
+    These are the client's fault and expected now and then, so they are logged
+    without a traceback and answered with a 400.
+    """
+    logger.info("Bad request data: %s", e)
+    return jsonify({'error': str(e)}), 400
+
+@app.errorhandler(HTTPException)
+def handle_http_exception(e):
+    """Handler for the HTTP errors Flask raises itself (unknown routes, bad bodies...)
+    
+    They keep their own status code and are not logged as server errors.
+    """
+    return jsonify({'error': e.description}), e.code
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     """Global exception handler for all routes"""
@@ -978,9 +1640,13 @@ def handle_exception(e):
 def detailed_health_check():
     """Detailed API health check endpoint with component status"""
     try:
-        # Test MediaPipe
-        test_image = np.zeros((100, 100, 3), dtype=np.uint8)
-        _ = face_mesh.process(test_image)
+        # Check that the inference threads are alive and responding. No test
+        # frame is sent through the models: they track the session's face and
+        # body from frame to frame and would lose them on a foreign frame.
+        if not inference_thread.is_alive():
+            raise RuntimeError("Inference worker has stopped")
+        face_mesh_executor.submit(lambda: None).result(timeout=INFERENCE_TIMEOUT)
+        pose_executor.submit(lambda: None).result(timeout=INFERENCE_TIMEOUT)
         
         return jsonify({
             "status": "online",
@@ -1000,6 +1666,9 @@ def detailed_health_check():
             "error": str(e)
         }), 500
 
+# In production run the app with gunicorn and the settings in gunicorn.conf.py:
+#   gunicorn app:app
+# python app.py starts Flask's development server instead.
 if __name__ == '__main__':
     # Record startup time
     startup_time = time.time()
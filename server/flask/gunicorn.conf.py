@@ -0,0 +1,24 @@
+# Gunicorn settings for the tracking service: gunicorn app:app
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# A single process: the tracking state of the session lives in process memory,
+# so frames of one session must all reach the same process
+workers = 1
+
+# Requests are served by threads. Frames of the session are run through the
+# tracking state one request at a time (see TrackingState.lock), so the extra
+# threads keep result polls and health checks answered while a batch is in
+# inference, and let the next request decode its frames in the meantime.
+# Async workers (gevent) would stall their event loop on the native MediaPipe
+# and OpenCV calls.
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', os.cpu_count() or 4))
+
+# The first frames can wait on model start-up
+timeout = 60
+
+# No preload_app: the inference worker thread is started on import and would
+# not survive the fork into the worker process
+preload_app = False